@@ -27,6 +27,86 @@ OPENROUTESERVICE_API_KEY = os.environ['OPENROUTESERVICE_API_KEY']
 MAPBOX_API_KEY = os.environ['MAPBOX_API_KEY']
 MAPBOX_API_KEY_PUBLIC = os.environ['MAPBOX_API_KEY_PUBLIC']
 
+# Maximum number of route segments optimized concurrently for a single request
+OPTIMIZATION_MAX_WORKERS = int(os.environ.get('OPTIMIZATION_MAX_WORKERS', 4))
+
+# Serve optimize-route with the async view, for ASGI deployments (SERVER_MODE=asgi in runserver.sh). Its Mapbox
+# and ORS requests share one httpx client per event loop with at most ASYNC_HTTP_MAX_CONNECTIONS connections
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_MAX_CONNECTIONS', 200))
+
+# Douglas-Peucker tolerances, in degrees, of the simplified route geometries served with ?detail=
+ROUTE_GEOMETRY_TOLERANCES = {
+    'medium': 0.0001,
+    'low': 0.001,
+}
+
+# Itinerary read responses (visits, daily routes, detail) are cached per itinerary and user in the 'responses'
+# cache and dropped by model signals. The signals only reach the cache of the process making the change, so a
+# per-process cache such as the default locmem one is only correct with a single process on its own; with locmem
+# the cache keys therefore also include Itinerary.version, read on every request. Deployments with several
+# processes set a shared backend, whose hits run no query, e.g. RESPONSE_CACHE_BACKEND set to
+# django.core.cache.backends.filebased.FileBasedCache with a directory as RESPONSE_CACHE_LOCATION, or to
+# django.core.cache.backends.db.DatabaseCache with a table name (created by `manage.py createcachetable`)
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+
+# Users of JWT-authenticated requests are cached by user id for AUTH_USER_CACHE_TTL seconds in the 'auth' cache and
+# dropped when the user is saved or deleted. The cache must be shared by every process serving requests, or a
+# deactivated user stays authenticated on the other processes until the TTL has passed, and must not be writable by
+# anyone else, as it holds pickled users. It is off (a dummy cache, every request loading its user) unless
+# AUTH_USER_CACHE_BACKEND and AUTH_USER_CACHE_LOCATION name one, e.g. django.core.cache.backends.redis.RedisCache
+# with the server URL. A per-process backend such as locmem is only correct with a single process
+AUTH_USER_CACHE_ALIAS = 'auth'
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+
+# Rows fetched per database round trip by streamed (?stream=1) list responses
+STREAMING_CHUNK_SIZE = int(os.environ.get('STREAMING_CHUNK_SIZE', 500))
+
+# Shared OpenRouteService HTTP client: pooled keep-alive connections, (connect, read) timeouts in seconds
+# and jittered exponential backoff on 429/5xx responses
+ORS_POOL_SIZE = int(os.environ.get('ORS_POOL_SIZE', 10))
+ORS_TIMEOUT = (float(os.environ.get('ORS_CONNECT_TIMEOUT', 5)), float(os.environ.get('ORS_READ_TIMEOUT', 60)))
+ORS_MAX_RETRIES = int(os.environ.get('ORS_MAX_RETRIES', 3))
+ORS_BACKOFF_BASE = 0.5
+ORS_BACKOFF_MAX = 8
+
+# Stored places within this distance of the itinerary start fill the trip before Mapbox is asked
+LOCAL_PLACES_RADIUS_KM = float(os.environ.get('LOCAL_PLACES_RADIUS_KM', 5))
+
+# Mapbox Search Box requests: timeout in seconds and the number of retrieve calls sent concurrently
+MAPBOX_TIMEOUT = (5, 30)
+MAPBOX_MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAPBOX_MAX_CONCURRENT_REQUESTS', 5))
+# Suggestions are cached per query and proximity tile (in degrees, 0.01 is about 1 km), retrieved places per id
+MAPBOX_CACHE_TILE_SIZE = 0.01
+MAPBOX_SUGGEST_CACHE_TTL = int(os.environ.get('MAPBOX_SUGGEST_CACHE_TTL', 24 * 3600))
+MAPBOX_RETRIEVE_CACHE_TTL = int(os.environ.get('MAPBOX_RETRIEVE_CACHE_TTL', 7 * 24 * 3600))
+
+# Queued (?async=1) optimize-route jobs, processed by `manage.py run_optimization_worker`
+OPTIMIZATION_WORKER_POLL_INTERVAL = float(os.environ.get('OPTIMIZATION_WORKER_POLL_INTERVAL', 1))
+OPTIMIZATION_JOB_TIMEOUT = int(os.environ.get('OPTIMIZATION_JOB_TIMEOUT', 600))
+
+# Route optimization backend: 'api.solvers.OpenRouteServiceSolver' or the offline 'api.solvers.LocalRouteSolver'
+ROUTE_SOLVER_BACKEND = os.environ.get('ROUTE_SOLVER_BACKEND', 'api.solvers.OpenRouteServiceSolver')
+
+# Travel-time model of the local solver: average speed (km/h) per ORS profile and a road detour factor
+LOCAL_SOLVER_SPEED_PROFILES = {
+    'driving-car': 30,
+    'cycling-regular': 15,
+    'foot-walking': 5,
+}
+LOCAL_SOLVER_DETOUR_FACTOR = 1.3
+
+# Travel matrix used by the local solver: 'api.matrix.HaversineMatrixSource' (offline)
+# or 'api.matrix.OpenRouteServiceMatrixSource' (road network, cached in TravelMatrixEntry)
+TRAVEL_MATRIX_SOURCE = os.environ.get('TRAVEL_MATRIX_SOURCE', 'api.matrix.HaversineMatrixSource')
+# Cached pairs are keyed by coordinates rounded to this many decimal places (5 is about 1 m)
+TRAVEL_MATRIX_CACHE_PRECISION = 5
+TRAVEL_MATRIX_CACHE_TTL = int(os.environ.get('TRAVEL_MATRIX_CACHE_TTL', 30 * 24 * 3600))
+TRAVEL_MATRIX_CACHE_MAX_ENTRIES = int(os.environ.get('TRAVEL_MATRIX_CACHE_MAX_ENTRIES', 500000))
+# Minimum seconds between two evictions of expired and excess entries in a process
+TRAVEL_MATRIX_EVICTION_INTERVAL = int(os.environ.get('TRAVEL_MATRIX_EVICTION_INTERVAL', 300))
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
 
@@ -51,11 +131,13 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
@@ -148,9 +230,50 @@ DATABASES = {
         "PASSWORD": os.environ.get("DB_PASSWORD", "password"),
         "HOST": os.environ.get("DB_HOST", "localhost"),
         "PORT": os.environ.get("DB_PORT", "5432"),
+        # Used by DB_ENGINE=api.db.postgresql_pool, which shares pooled psycopg2 connections between the threads
+        # of a process (gunicorn gthread workers need MAX_SIZE >= --threads). Connections are returned to the
+        # pool at the end of each request, so CONN_MAX_AGE stays 0. Pool stats are under db_pool.* in /metrics/
+        "POOL": {
+            "MIN_SIZE": int(os.environ.get("DB_POOL_MIN_SIZE", 1)),
+            "MAX_SIZE": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            # Seconds a request waits for a free connection, then lifetime in seconds of a pooled connection
+            "TIMEOUT": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            "MAX_LIFETIME": float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+            "HEALTH_CHECK": os.environ.get("DB_POOL_HEALTH_CHECK", "1") == "1",
+        },
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'mapbox': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mapbox',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('MAPBOX_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    'auth': {
+        'BACKEND': os.environ.get('AUTH_USER_CACHE_BACKEND', 'django.core.cache.backends.dummy.DummyCache'),
+        'LOCATION': os.environ.get('AUTH_USER_CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('AUTH_USER_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    'responses': {
+        'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
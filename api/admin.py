@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from api.models import Itinerary, Place, Visit, DailyRoute
+from api.models import Category, Itinerary, Place, Visit, DailyRoute
 
 
 # Register your models here.
@@ -13,14 +13,22 @@ class ItineraryAdmin(admin.ModelAdmin):
 
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'address', 'category')
+    list_display = ('name', 'address', 'category', 'duration')
     search_fields = ('name', 'address')
-    list_filter = ('category',)
+    list_filter = ('categories',)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'duration')
+    list_editable = ('duration',)
+    search_fields = ('name',)
 
 
 @admin.register(Visit)
 class VisitAdmin(admin.ModelAdmin):
     list_display = ('itinerary', 'place', 'day', 'duration')
+    list_select_related = ('itinerary', 'place')
     search_fields = ('itinerary__title', 'place__name')
     list_filter = ('itinerary', 'day')
 
@@ -28,5 +36,6 @@ class VisitAdmin(admin.ModelAdmin):
 @admin.register(DailyRoute)
 class DailyRouteAdmin(admin.ModelAdmin):
     list_display = ('itinerary', 'day')
+    list_select_related = ('itinerary',)
     search_fields = ('itinerary__title',)
     list_filter = ('itinerary', 'day')
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import openrouteservice
+import requests
+from django.conf import settings
+from openrouteservice import exceptions
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_ors_client = None
+_ors_client_lock = threading.Lock()
+_mapbox_session = None
+_mapbox_session_lock = threading.Lock()
+# httpx.AsyncClient instances can only be used on the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def connection_error(exc):
+    """The ORS error raised once a request could not reach the service, like the API's own 503 responses."""
+    return exceptions.ApiError(503, f"Could not reach OpenRouteService: {exc}")
+
+
+class PooledORSClient(openrouteservice.Client):
+    """
+    ORS client sharing one pooled keep-alive session, retrying 429/5xx responses and timeouts with
+    jittered exponential backoff and recording retry and latency metrics.
+    """
+
+    RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, key, pool_size, max_retries, backoff_base, backoff_max, **kwargs):
+        super().__init__(key=key, **kwargs)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+
+    def request(self, url, get_params=None, first_request_time=None, retry_counter=0, requests_kwargs=None,
+                post_json=None, dry_run=None):
+        if dry_run:
+            return super().request(url, get_params, requests_kwargs=requests_kwargs, post_json=post_json,
+                                   dry_run=dry_run)
+
+        final_requests_kwargs = dict(self._requests_kwargs, **(requests_kwargs or {}))
+        requests_method = self._session.get
+        if post_json is not None:
+            requests_method = self._session.post
+            final_requests_kwargs['json'] = post_json
+        full_url = self._base_url + self._generate_auth_url(url, get_params)
+
+        for attempt in range(self._max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = requests_method(full_url, **final_requests_kwargs)
+            except requests.exceptions.Timeout:
+                metrics.observe('ors.latency', time.perf_counter() - start)
+                metrics.increment('ors.timeouts')
+                if attempt == self._max_retries:
+                    raise exceptions.Timeout()
+                self._backoff(url, attempt, 'timeout')
+                continue
+            except requests.exceptions.ConnectionError as exc:
+                metrics.observe('ors.latency', time.perf_counter() - start)
+                metrics.increment('ors.connection_errors')
+                if attempt == self._max_retries:
+                    raise connection_error(exc) from exc
+                self._backoff(url, attempt, 'connection error')
+                continue
+
+            metrics.observe('ors.latency', time.perf_counter() - start)
+            self._req = response.request
+
+            if response.status_code in self.RETRIABLE_STATUSES and attempt < self._max_retries:
+                self._backoff(url, attempt, response.status_code, response.headers.get('Retry-After'))
+                continue
+
+            metrics.increment(f'ors.status.{response.status_code}')
+            return self._get_body(response)
+
+    def _backoff(self, url, attempt, reason, retry_after=None):
+        time.sleep(self._backoff_delay(url, attempt, reason, retry_after))
+
+    def _backoff_delay(self, url, attempt, reason, retry_after=None):
+        delay = min(self._backoff_max, self._backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self._backoff_max))
+
+        metrics.increment('ors.retries')
+        logger.warning("ORS request to %s failed (%s), retry %d in %.2fs", url, reason, attempt + 1, delay)
+        return delay
+
+
+class AsyncORSClient:
+    """
+    Asynchronous counterpart of ``PooledORSClient`` for ``POST`` requests, on a shared ``httpx.AsyncClient``.
+
+    It applies the same retries, backoff and metrics while waiting on the event loop instead of a thread.
+    """
+
+    def __init__(self, sync_client, http_client):
+        self._sync_client = sync_client
+        self._http_client = http_client
+
+    async def request(self, url, post_json):
+        client = self._sync_client
+        headers = client._requests_kwargs['headers']
+        full_url = client._base_url + url
+
+        for attempt in range(client._max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await self._http_client.post(full_url, json=post_json, headers=headers)
+            except httpx.TimeoutException:
+                metrics.observe('ors.latency', time.perf_counter() - start)
+                metrics.increment('ors.timeouts')
+                if attempt == client._max_retries:
+                    raise exceptions.Timeout()
+                await asyncio.sleep(client._backoff_delay(url, attempt, 'timeout'))
+                continue
+            except httpx.TransportError as exc:
+                metrics.observe('ors.latency', time.perf_counter() - start)
+                metrics.increment('ors.connection_errors')
+                if attempt == client._max_retries:
+                    raise connection_error(exc) from exc
+                await asyncio.sleep(client._backoff_delay(url, attempt, 'connection error'))
+                continue
+
+            metrics.observe('ors.latency', time.perf_counter() - start)
+
+            if response.status_code in client.RETRIABLE_STATUSES and attempt < client._max_retries:
+                await asyncio.sleep(client._backoff_delay(url, attempt, response.status_code,
+                                                          response.headers.get('Retry-After')))
+                continue
+
+            metrics.increment(f'ors.status.{response.status_code}')
+            return client._get_body(response)
+
+
+def get_ors_client():
+    """Return the process-wide ORS client, creating it on first use."""
+    global _ors_client
+
+    if _ors_client is None:
+        with _ors_client_lock:
+            if _ors_client is None:
+                _ors_client = PooledORSClient(
+                    key=settings.OPENROUTESERVICE_API_KEY,
+                    pool_size=settings.ORS_POOL_SIZE,
+                    max_retries=settings.ORS_MAX_RETRIES,
+                    backoff_base=settings.ORS_BACKOFF_BASE,
+                    backoff_max=settings.ORS_BACKOFF_MAX,
+                    timeout=settings.ORS_TIMEOUT,
+                )
+    return _ors_client
+
+
+def get_mapbox_session():
+    """Return the process-wide keep-alive session used for Mapbox requests."""
+    global _mapbox_session
+
+    if _mapbox_session is None:
+        with _mapbox_session_lock:
+            if _mapbox_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.MAPBOX_MAX_CONCURRENT_REQUESTS)
+                session.mount('https://', adapter)
+                _mapbox_session = session
+    return _mapbox_session
+
+
+def get_async_http_client():
+    """
+    Return the ``httpx.AsyncClient`` of the running event loop, creating it on first use.
+
+    One client per loop keeps up to ``ASYNC_HTTP_MAX_CONNECTIONS`` keep-alive connections shared by all the
+    requests the loop is serving.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.ORS_TIMEOUT[1], connect=settings.ORS_TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS),
+        )
+    return client
+
+
+def get_async_ors_client():
+    return AsyncORSClient(get_ors_client(), get_async_http_client())
@@ -0,0 +1,53 @@
+import math
+
+
+def sweep_partition(origin, coordinates, weights, capacities):
+    """
+    Split points into angular sectors around ``origin`` sized proportionally to ``capacities``.
+
+    ``coordinates`` are (longitude, latitude) pairs and ``weights`` their visit durations. Points are swept by
+    bearing from ``origin``, starting right after the widest empty sector, so that every group covers a compact
+    wedge of the map. Each group receives a share of the total weight proportional to its capacity.
+    Returns a list of index lists, one per capacity. Groups may be empty when there are few points or when a
+    heavy point covers the share of a whole group.
+    """
+    if not coordinates:
+        return [[] for _ in capacities]
+
+    origin_longitude, origin_latitude = origin
+    longitude_scale = math.cos(math.radians(origin_latitude))
+
+    polar = sorted(
+        (math.atan2(latitude - origin_latitude, (longitude - origin_longitude) * longitude_scale),
+         math.hypot(latitude - origin_latitude, (longitude - origin_longitude) * longitude_scale),
+         index)
+        for index, (longitude, latitude) in enumerate(coordinates)
+    )
+
+    # Start the sweep after the widest gap between consecutive bearings
+    gaps = [
+        (polar[(position + 1) % len(polar)][0] - polar[position][0]) % (2 * math.pi)
+        for position in range(len(polar))
+    ]
+    start = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(polar)
+    order = [index for _, _, index in polar[start:] + polar[:start]]
+
+    total_weight = sum(weights)
+    total_capacity = sum(capacities)
+    boundaries = []
+    cumulative_capacity = 0
+    for capacity in capacities:
+        cumulative_capacity += capacity
+        boundaries.append(total_weight * cumulative_capacity / total_capacity)
+
+    groups = [[] for _ in capacities]
+    group = 0
+    cumulative_weight = 0
+    for index in order:
+        midpoint = cumulative_weight + weights[index] / 2
+        while group < len(groups) - 1 and midpoint > boundaries[group]:
+            group += 1
+        groups[group].append(index)
+        cumulative_weight += weights[index]
+
+    return groups
@@ -0,0 +1,46 @@
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Itinerary
+
+
+class ItineraryStateMixin:
+    def itinerary_state(self, itinerary_id):
+        """(version, updated_at) of the itinerary, None when it does not exist; read once per request."""
+        states = self.__dict__.setdefault('_itinerary_states', {})
+        if str(itinerary_id) not in states:
+            states[str(itinerary_id)] = Itinerary.objects.filter(pk=itinerary_id).values_list(
+                'version', 'updated_at').first()
+        return states[str(itinerary_id)]
+
+
+class ItineraryConditionalMixin(ItineraryStateMixin):
+    """
+    Conditional GET for views rendering the data of one itinerary, validated by ``Itinerary.version``.
+
+    The version and modification time are read with a single primary key lookup, so a poll answered with
+    304 Not Modified never loads the visits or route geometry.
+    """
+
+    def itinerary_validators(self, itinerary_id, *variant):
+        """(ETag, Last-Modified timestamp) of the itinerary; ``variant`` tells apart its representations."""
+        row = self.itinerary_state(itinerary_id)
+        if row is None:
+            raise Http404
+        version, updated_at = row
+        etag = quote_etag('-'.join(str(part) for part in (itinerary_id, version, *variant)))
+        return etag, int(updated_at.timestamp())
+
+    def not_modified_response(self, request, validators):
+        """The 304 (or 412) response for the request's conditional headers, None when it must be served."""
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        return None if response is None else self.with_validators(response, validators)
+
+    @staticmethod
+    def with_validators(response, validators):
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
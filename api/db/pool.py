@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(OperationalError):
+    """No connection was returned to the pool within its checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections shared by every thread of a process.
+
+    At most ``max_size`` connections are open at once; checkouts beyond that wait up to ``timeout`` seconds for
+    one to be returned. ``min_size`` connections are opened on the first checkout and kept open. Idle connections
+    older than ``max_lifetime`` seconds are replaced, and with ``health_check`` an idle connection must pass
+    ``check`` before it is handed out. Checkout waits, timeouts and the number of connections in use are
+    recorded in ``api.metrics`` under ``name``.
+    """
+
+    def __init__(self, name, connect, check=None, min_size=0, max_size=10, timeout=10.0, max_lifetime=None,
+                 health_check=True):
+        self.name = name
+        self.connect = connect
+        self.check = check
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check and check is not None
+
+        self._condition = threading.Condition()
+        # Idle connections, the most recently returned last; open times are kept by id in _opened_at
+        self._idle = deque()
+        self._opened_at = {}
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._warmed = False
+
+    def checkout(self):
+        started = time.monotonic()
+        with self._condition:
+            self._after_fork()
+            warm = not self._warmed
+            self._warmed = True
+            while not self._idle and self._open_count() >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    metrics.increment(f'{self.name}.timeouts')
+                    raise PoolTimeout(
+                        f"No database connection available in the {self.name} pool within {self.timeout}s.")
+                self._condition.wait(remaining)
+            reserved = self._idle.pop() if self._idle else None
+            self._in_use += 1
+            self._publish()
+
+        try:
+            connection = self._prepare(reserved)
+        except BaseException:
+            with self._condition:
+                self._in_use -= 1
+                self._publish()
+                self._condition.notify()
+            raise
+
+        metrics.observe(f'{self.name}.wait', time.monotonic() - started)
+        if warm:
+            self._warm_up()
+        return connection
+
+    def checkin(self, connection, discard=False):
+        """Return a checked out connection; ``discard`` closes it instead, e.g. after an error."""
+        with self._condition:
+            if os.getpid() != self._pid:
+                # Inherited from the parent process, which owns the socket
+                return
+            self._in_use -= 1
+            discard = discard or self._expired(connection)
+            if discard:
+                self._opened_at.pop(id(connection), None)
+            else:
+                self._idle.append(connection)
+            self._publish()
+            self._condition.notify()
+        if discard:
+            self._close(connection)
+
+    def close_all(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            for connection in idle:
+                self._opened_at.pop(id(connection), None)
+            self._publish()
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self._condition:
+            return {'in_use': self._in_use, 'idle': len(self._idle), 'max_size': self.max_size}
+
+    def _prepare(self, connection):
+        """Hand out ``connection`` if it is still fit for use, a new connection otherwise."""
+        if connection is not None and self._expired(connection):
+            metrics.increment(f'{self.name}.expired')
+            connection = self._discard(connection)
+        if connection is not None and self.health_check and not self._healthy(connection):
+            metrics.increment(f'{self.name}.health_check_failures')
+            connection = self._discard(connection)
+        if connection is None:
+            connection = self._open()
+        return connection
+
+    def _warm_up(self):
+        while True:
+            with self._condition:
+                if self._open_count() >= self.min_size:
+                    return
+                # Counted as in use while it connects, so that concurrent checkouts respect max_size
+                self._in_use += 1
+            try:
+                connection = self._open()
+            except Exception:
+                logger.exception("Could not open a connection for the %s pool", self.name)
+                with self._condition:
+                    self._in_use -= 1
+                return
+            self.checkin(connection)
+
+    def _open(self):
+        connection = self.connect()
+        with self._condition:
+            self._opened_at[id(connection)] = time.monotonic()
+        metrics.increment(f'{self.name}.connections_opened')
+        return connection
+
+    def _discard(self, connection):
+        with self._condition:
+            self._opened_at.pop(id(connection), None)
+        self._close(connection)
+        return None
+
+    def _healthy(self, connection):
+        try:
+            self.check(connection)
+        except Exception:
+            return False
+        return True
+
+    def _expired(self, connection):
+        if self.max_lifetime is None:
+            return False
+        opened_at = self._opened_at.get(id(connection))
+        return opened_at is None or time.monotonic() - opened_at > self.max_lifetime
+
+    def _open_count(self):
+        return self._in_use + len(self._idle)
+
+    def _after_fork(self):
+        # Connections opened before a fork (e.g. gunicorn --preload) belong to the parent process
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._opened_at.clear()
+            self._in_use = 0
+            self._warmed = False
+
+    def _publish(self):
+        metrics.gauge(f'{self.name}.in_use', self._in_use)
+        metrics.gauge(f'{self.name}.idle', len(self._idle))
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            logger.warning("Could not close a pooled database connection", exc_info=True)
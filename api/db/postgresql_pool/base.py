@@ -0,0 +1,90 @@
+import threading
+
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2 import extensions
+
+from ..pool import ConnectionPool
+
+# Pool options of the POOL dict in the database settings
+DEFAULT_POOL_OPTIONS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_LIFETIME': 1800,
+    'HEALTH_CHECK': True,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if not connection.autocommit:
+        connection.rollback()
+
+
+class PostgreSQLPool(ConnectionPool):
+    def __init__(self, wrapper):
+        options = dict(DEFAULT_POOL_OPTIONS, **wrapper.settings_dict.get('POOL', {}))
+        # Opens the pooled connections with the stock backend, so they are set up exactly like unpooled ones
+        self.connector = base.DatabaseWrapper(wrapper.settings_dict, wrapper.alias)
+        conn_params = wrapper.get_connection_params()
+        super().__init__(
+            f'db_pool.{wrapper.alias}',
+            connect=lambda: self.connector.get_new_connection(conn_params),
+            check=check_connection,
+            min_size=options['MIN_SIZE'],
+            max_size=options['MAX_SIZE'],
+            timeout=options['TIMEOUT'],
+            max_lifetime=options['MAX_LIFETIME'],
+            health_check=options['HEALTH_CHECK'],
+        )
+
+
+def get_pool(wrapper):
+    """The process-wide pool of the wrapper's database alias, created on first use."""
+    with _pools_lock:
+        if wrapper.alias not in _pools:
+            _pools[wrapper.alias] = PostgreSQLPool(wrapper)
+        return _pools[wrapper.alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL (psycopg2) backend taking its connections from a ``ConnectionPool`` shared by the threads of the
+    process.
+
+    Closing the connection, which Django does at the end of each request with ``CONN_MAX_AGE = 0``, returns it to
+    the pool after rolling back any open transaction.
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self)
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        connection = pool.checkout()
+        self.isolation_level = pool.connector.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # A connection closed inside an atomic block is still referenced until the block exits, so it cannot be
+        # handed to another thread
+        discard = self.in_atomic_block or self.connection.closed or not self._reset(self.connection)
+        self.pool.checkin(self.connection, discard=discard)
+
+    def _reset(self, connection):
+        if connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        try:
+            connection.rollback()
+        except self.Database.Error:
+            return False
+        return connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
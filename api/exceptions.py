@@ -0,0 +1,9 @@
+from rest_framework.exceptions import NotFound
+
+
+class PlacesNotFound(NotFound):
+    """404 listing every requested place id that does not exist, kept as integers in the response."""
+
+    def __init__(self, missing_place_ids):
+        super().__init__()
+        self.detail = {"detail": "Places not found.", "missing_place_ids": missing_place_ids}
@@ -0,0 +1,31 @@
+from django.db import models
+
+from .geometry import pack_polyline, unpack_polyline
+
+
+class CompressedPolylineField(models.BinaryField):
+    """Encoded polyline string in Python, stored as packed and compressed binary (see ``pack_polyline``)."""
+
+    description = "Compressed encoded polyline"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        return unpack_polyline(bytes(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return unpack_polyline(bytes(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = pack_polyline(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
@@ -0,0 +1,172 @@
+import math
+import zlib
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def haversine_distance(origin, destination):
+    """Great-circle distance in meters between two (longitude, latitude) pairs."""
+    lon1, lat1 = map(math.radians, origin)
+    lon2, lat2 = map(math.radians, destination)
+
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+# Leading byte of packed geometries
+RAW_TEXT_FORMAT = 0
+DELTA_VARINT_FORMAT = 1
+
+
+def encode_polyline(coordinates, precision=5):
+    """Encode (longitude, latitude) pairs into the encoded polyline format returned by ORS."""
+    factor = 10 ** precision
+    return encode_points([
+        (round(latitude * factor), round(longitude * factor)) for longitude, latitude in coordinates
+    ])
+
+
+def encode_points(points):
+    """Encode integer (latitude, longitude) points, in 1e-5 degrees, as a polyline string."""
+    encoded = []
+    previous_lat = previous_lon = 0
+
+    for lat, lon in points:
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            encoded.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+
+    return ''.join(encoded)
+
+
+def decode_points(polyline):
+    """
+    Decode a polyline string into integer (latitude, longitude) points in 1e-5 degrees.
+
+    Returns None when the string is not a canonical encoded polyline, i.e. when encoding the points again
+    would not give back the same string.
+    """
+    deltas = []
+    index = 0
+    try:
+        while index < len(polyline):
+            result = shift = 0
+            while True:
+                byte = ord(polyline[index]) - 63
+                index += 1
+                if not 0 <= byte < 0x40:
+                    return None
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+    except IndexError:
+        return None
+
+    if len(deltas) % 2:
+        return None
+
+    points = []
+    lat = lon = 0
+    for position in range(0, len(deltas), 2):
+        lat += deltas[position]
+        lon += deltas[position + 1]
+        points.append((lat, lon))
+
+    if encode_points(points) != polyline:
+        return None
+    return points
+
+
+def pack_polyline(polyline):
+    """
+    Pack a polyline into compact bytes: zigzag varint coordinate deltas compressed with zlib.
+
+    Strings that are not canonical polylines are stored as compressed text so that they round-trip unchanged.
+    """
+    points = decode_points(polyline)
+    if points is None:
+        return bytes([RAW_TEXT_FORMAT]) + zlib.compress(polyline.encode(), 9)
+
+    packed = bytearray()
+    previous_lat = previous_lon = 0
+    for lat, lon in points:
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = (delta << 1) ^ (delta >> 63)
+            while value >= 0x80:
+                packed.append(0x80 | (value & 0x7f))
+                value >>= 7
+            packed.append(value)
+        previous_lat, previous_lon = lat, lon
+
+    return bytes([DELTA_VARINT_FORMAT]) + zlib.compress(bytes(packed), 9)
+
+
+def unpack_polyline(data):
+    """Inverse of ``pack_polyline``."""
+    if not data:
+        return ''
+
+    payload = zlib.decompress(data[1:])
+    if data[0] == RAW_TEXT_FORMAT:
+        return payload.decode()
+
+    deltas = []
+    value = shift = 0
+    for byte in payload:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            deltas.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+
+    points = []
+    lat = lon = 0
+    for position in range(0, len(deltas), 2):
+        lat += deltas[position]
+        lon += deltas[position + 1]
+        points.append((lat, lon))
+    return encode_points(points)
+
+
+def simplify_polyline(polyline, tolerance):
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm, ``tolerance`` being in degrees.
+
+    Strings that are not canonical polylines are returned unchanged.
+    """
+    points = decode_points(polyline)
+    if points is None or len(points) < 3:
+        return polyline
+
+    tolerance = tolerance * 1e5
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        (lat1, lon1), (lat2, lon2) = points[first], points[last]
+        length = math.hypot(lat2 - lat1, lon2 - lon1)
+
+        farthest, max_distance = None, tolerance
+        for index in range(first + 1, last):
+            lat, lon = points[index]
+            if length:
+                distance = abs((lat2 - lat1) * (lon1 - lon) - (lat1 - lat) * (lon2 - lon1)) / length
+            else:
+                distance = math.hypot(lat - lat1, lon - lon1)
+            if distance > max_distance:
+                farthest, max_distance = index, distance
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return encode_points([point for point, kept in zip(points, keep) if kept])
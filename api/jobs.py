@@ -0,0 +1,68 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from .models import OptimizationJob
+from .views import OptimizeRouteView
+
+logger = logging.getLogger(__name__)
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run, i.e. running for longer than ``OPTIMIZATION_JOB_TIMEOUT``."""
+    return OptimizationJob.objects.filter(
+        status=OptimizationJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=settings.OPTIMIZATION_JOB_TIMEOUT)
+    ).update(status=OptimizationJob.STATUS_PENDING, started_at=None)
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest pending job to running and return it, or None when the queue is empty.
+
+    Claiming is a conditional UPDATE on the status, so several workers can poll the same table safely
+    without row locks or an external broker.
+    """
+    while True:
+        job = OptimizationJob.objects.filter(
+            status=OptimizationJob.STATUS_PENDING
+        ).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+
+        claimed = OptimizationJob.objects.filter(pk=job.pk, status=OptimizationJob.STATUS_PENDING).update(
+            status=OptimizationJob.STATUS_RUNNING,
+            started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def process_job(job):
+    try:
+        result, result_status = OptimizeRouteView().optimize(job.itinerary_id, job.places)
+    except Http404 as exc:
+        job.status = OptimizationJob.STATUS_FAILED
+        job.error = str(exc) or 'Not found.'
+    except APIException as exc:
+        job.status = OptimizationJob.STATUS_FAILED
+        job.error = str(exc)
+        job.result = exc.detail
+        job.result_status = exc.status_code
+    except Exception as exc:
+        logger.exception("Optimization job %s failed", job.id)
+        job.status = OptimizationJob.STATUS_FAILED
+        job.error = str(exc)
+    else:
+        job.status = OptimizationJob.STATUS_SUCCEEDED if result_status < 400 else OptimizationJob.STATUS_FAILED
+        job.result = result
+        job.result_status = result_status
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'result_status', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,79 @@
+import time
+import uuid
+from datetime import date, time as clock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Itinerary, Place, Visit
+from api.serializers import ItinerarySerializer, VisitSerializer
+from api.values import ValuesSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare ModelSerializer and ValuesSerializer throughput (rows per second) on the hot list endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help="Number of itineraries and of visits to render.")
+        parser.add_argument('--repeat', type=int, default=5, help="Best of this many runs is reported.")
+
+    def handle(self, *args, **options):
+        rows, repeat = max(options['rows'], 1), max(options['repeat'], 1)
+
+        # The sample data only lives for the duration of the benchmark
+        with transaction.atomic():
+            itineraries, visits = self.sample_data(rows)
+            for name, serializer_class, queryset in [
+                ('itineraries', ItinerarySerializer, itineraries),
+                ('visits', VisitSerializer, visits.select_related('place')),
+            ]:
+                self.compare(name, serializer_class, queryset, rows, repeat)
+            transaction.set_rollback(True)
+
+    def compare(self, name, serializer_class, queryset, rows, repeat):
+        values_serializer = ValuesSerializer(serializer_class)
+
+        def model_path():
+            return serializer_class(queryset.all(), many=True).data
+
+        def values_path():
+            return values_serializer.serialize(values_serializer.values(queryset.all()))
+
+        if [dict(item) for item in model_path()] != values_path():
+            raise CommandError(f"{name}: ValuesSerializer output differs from {serializer_class.__name__}.")
+
+        before, after = self.best_time(model_path, repeat), self.best_time(values_path, repeat)
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(f"  {serializer_class.__name__}: {rows / before:,.0f} rows/s")
+        self.stdout.write(f"  ValuesSerializer: {rows / after:,.0f} rows/s ({before / after:.1f}x)")
+
+    @staticmethod
+    def best_time(render, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    @staticmethod
+    def sample_data(rows):
+        user = User.objects.create_user(username=f'benchmark_{uuid.uuid4()}')
+        itineraries = Itinerary.objects.bulk_create([
+            Itinerary(user=user, title=f'Itinerary {idx}', destination='Benchmark', description='',
+                      start_place_latitude=0.0, start_place_longitude=0.0, start_date=date(2023, 1, 1),
+                      end_date=date(2023, 1, 10), start_hour=clock(9), end_hour=clock(18))
+            for idx in range(rows)
+        ])
+        places = Place.objects.bulk_create([
+            Place(name=f'Benchmark place {idx}', description='', address='', latitude=0.0001 * idx,
+                  longitude=0.0001 * idx, category='museum')
+            for idx in range(rows)
+        ])
+        Visit.objects.bulk_create([
+            Visit(itinerary=itineraries[0], place=place, day=idx % 10 + 1, duration=60, start_time=clock(9))
+            for idx, place in enumerate(places)
+        ])
+        return (Itinerary.objects.filter(user=user).order_by('id'),
+                Visit.objects.filter(itinerary__user=user).order_by('day', 'start_time', 'id'))
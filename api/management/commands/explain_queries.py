@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import Itinerary, Place, Visit, DailyRoute
+from api.pagination import KeysetPagination
+from api.views import ItineraryViewSet, PlaceViewSet, VisitViewSet, RouteViewSet
+
+
+class Command(BaseCommand):
+    help = "Print the query plan of each endpoint's main query and flag full table scans and sorts."
+
+    # Queries whose sort no index can serve, and why it is accepted
+    EXPECTED_SORTS = {
+        'POST /api/optimize-route/ (local places)': "ordered by a distance computed per row; only the places of "
+                                                    "the grid cells around the itinerary start are sorted",
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="User id to plan the queries for (default: any user).")
+        parser.add_argument('--itinerary', type=int, help="Itinerary id to plan the queries for (default: any).")
+        parser.add_argument('--strict', action='store_true', help="Exit with an error when a scan or sort is found.")
+
+    def handle(self, *args, **options):
+        itinerary = Itinerary.objects.order_by('id').first()
+        user_id = options['user'] or (itinerary.user_id if itinerary else 0)
+        itinerary_id = options['itinerary'] or (itinerary.id if itinerary else 0)
+
+        scans, sorts = [], []
+        for name, queryset in self.endpoint_queries(user_id, itinerary_id):
+            plan = queryset.explain()
+            flagged = [line for line in plan.splitlines() if self.is_scan(line) or self.is_sort(line)]
+            if any(self.is_scan(line) for line in flagged):
+                scans.append(name)
+            if any(self.is_sort(line) for line in flagged):
+                if name in self.EXPECTED_SORTS:
+                    flagged = [line for line in flagged if not self.is_sort(line)]
+                else:
+                    sorts.append(name)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            for line in plan.splitlines():
+                self.stdout.write(self.style.WARNING(line) if line in flagged else line)
+            if name in self.EXPECTED_SORTS:
+                self.stdout.write(self.style.NOTICE(f"Sort expected: {self.EXPECTED_SORTS[name]}"))
+            self.stdout.write('')
+
+        messages = []
+        if scans:
+            messages.append(f"Full table scans in: {', '.join(scans)}")
+        if sorts:
+            messages.append(f"Sorts not served by an index in: {', '.join(sorts)}")
+        if messages:
+            if options['strict']:
+                raise CommandError('\n'.join(messages))
+            for message in messages:
+                self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No full table scans or sorts."))
+
+    @staticmethod
+    def is_scan(line):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in line
+        # SQLite reports index walks as "SCAN table USING [COVERING] INDEX"
+        return 'SCAN ' in line and 'USING' not in line and 'CONSTANT ROW' not in line
+
+    @staticmethod
+    def is_sort(line):
+        if connection.vendor == 'postgresql':
+            # "Sort" and "Incremental Sort" nodes, not their "Sort Key" or "Sort Method" details
+            return line.lstrip(' ->').startswith(('Sort  (', 'Incremental Sort  ('))
+        return 'USE TEMP B-TREE' in line
+
+    @staticmethod
+    def keyset_page(queryset, view_class, position):
+        """The query of a deep keyset page, i.e. the one after ``position``."""
+        pagination = KeysetPagination()
+        pagination.ordering = getattr(view_class, 'keyset_ordering', pagination.ordering)
+        return queryset.order_by(*pagination.ordering).filter(pagination.after(position))[:pagination.page_size + 1]
+
+    def endpoint_queries(self, user_id, itinerary_id):
+        some_place = Place.objects.order_by('id').first() or Place(name='', latitude=0, longitude=0)
+        itineraries = Itinerary.objects.filter(user_id=user_id).values('id')
+        return [
+            ('GET /api/itineraries/', self.keyset_page(
+                Itinerary.objects.filter(user_id=user_id), ItineraryViewSet, [0])),
+            ('GET /api/places/', self.keyset_page(Place.objects.all(), PlaceViewSet, [0])),
+            ('GET /api/visits/', self.keyset_page(
+                Visit.objects.filter(itinerary__in=itineraries).select_related('place'), VisitViewSet,
+                [itinerary_id, 1, '09:00', 0])),
+            ('GET /api/routes/', self.keyset_page(
+                DailyRoute.objects.filter(itinerary__in=itineraries), RouteViewSet, [itinerary_id, 1, 0])),
+            ('GET /api/itinerary/<id>/visits/', Visit.objects.filter(itinerary_id=itinerary_id)
+                .select_related('place').order_by('day', 'start_time')),
+            ('GET /api/itinerary/<id>/daily-routes/<day>', DailyRoute.objects.filter(itinerary_id=itinerary_id, day=1)),
+            ('POST /api/optimize-route/ (stored places)', Place.objects.filter(
+                name__in=[some_place.name], latitude__in=[some_place.latitude], longitude__in=[some_place.longitude])),
+            ('POST /api/optimize-route/ (local places)', Place.objects.exclude(pk__in=[some_place.pk or 0]).nearest(
+                some_place.latitude, some_place.longitude, settings.LOCAL_PLACES_RADIUS_KM)),
+        ]
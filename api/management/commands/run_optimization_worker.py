@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import claim_next_job, process_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued optimize-route jobs stored in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeue_stale_jobs()
+            job = claim_next_job()
+
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(settings.OPTIMIZATION_WORKER_POLL_INTERVAL)
+                continue
+
+            job = process_job(job)
+            self.stdout.write(f"Optimization job {job.id} {job.status}")
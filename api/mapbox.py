@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.core.cache import caches
+
+from .clients import get_async_http_client, get_mapbox_session
+
+SEARCHBOX_URL = "https://api.mapbox.com/search/searchbox/v1"
+
+logger = logging.getLogger(__name__)
+
+
+def get_json(url):
+    """The JSON body of a Mapbox response, empty for error responses (401, 429, 5xx...)."""
+    if settings.DEBUG:
+        print(url)
+
+    response = get_mapbox_session().get(url, timeout=settings.MAPBOX_TIMEOUT)
+    if not response.ok:
+        logger.warning("Mapbox request failed with HTTP %s", response.status_code)
+        return {}
+    response.encoding = 'utf-8'
+    return response.json()
+
+
+async def aget_json(url):
+    if settings.DEBUG:
+        print(url)
+
+    connect_timeout, read_timeout = settings.MAPBOX_TIMEOUT
+    response = await get_async_http_client().get(url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+    if not response.is_success:
+        logger.warning("Mapbox request failed with HTTP %s", response.status_code)
+        return {}
+    return response.json()
+
+
+def snap_to_tile(longitude, latitude):
+    """Snap a point to the centre of its ``MAPBOX_CACHE_TILE_SIZE`` degree tile."""
+    size = settings.MAPBOX_CACHE_TILE_SIZE
+    return round(round(longitude / size) * size, 6), round(round(latitude / size) * size, 6)
+
+
+def suggest(query, longitude, latitude, session_token):
+    """
+    Return Mapbox suggestions for ``query`` near the point.
+
+    Suggestions are cached per query and proximity tile, so nearby itineraries share one lookup. Failed or empty
+    lookups are not cached.
+    """
+    tile_longitude, tile_latitude = snap_to_tile(longitude, latitude)
+    cache = caches['mapbox']
+    cache_key = f"suggest:{query}:{tile_longitude}:{tile_latitude}"
+
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        suggestions = fetch_suggestions(query, f"{tile_longitude},{tile_latitude}", session_token)
+        if suggestions:
+            cache.set(cache_key, suggestions, settings.MAPBOX_SUGGEST_CACHE_TTL)
+    return suggestions
+
+
+async def asuggest(query, longitude, latitude, session_token):
+    """``suggest`` for async views, sharing its cache and caching rules."""
+    tile_longitude, tile_latitude = snap_to_tile(longitude, latitude)
+    cache = caches['mapbox']
+    cache_key = f"suggest:{query}:{tile_longitude}:{tile_latitude}"
+
+    suggestions = await cache.aget(cache_key)
+    if suggestions is None:
+        url = suggest_url(query, f"{tile_longitude},{tile_latitude}", session_token)
+        suggestions = (await aget_json(url)).get('suggestions', [])
+        if suggestions:
+            await cache.aset(cache_key, suggestions, settings.MAPBOX_SUGGEST_CACHE_TTL)
+    return suggestions
+
+
+def fetch_suggestions(query, proximity, session_token):
+    return get_json(suggest_url(query, proximity, session_token)).get('suggestions', [])
+
+
+def suggest_url(query, proximity, session_token):
+    return (
+        f"{SEARCHBOX_URL}/suggest"
+        f"?q={query}"
+        f"&access_token={settings.MAPBOX_API_KEY}"
+        f"&language=en"
+        f"&limit=10"
+        f"&types=category,poi"
+        f"&proximity={proximity}"
+        f"&session_token={session_token}"
+    )
+
+
+def retrieve(mapbox_id, session_token):
+    return get_json(retrieve_url(mapbox_id, session_token))
+
+
+def retrieve_url(mapbox_id, session_token):
+    return (
+        f"{SEARCHBOX_URL}/retrieve/"
+        f"{mapbox_id}"
+        f"?access_token={settings.MAPBOX_API_KEY}"
+        f"&session_token={session_token}"
+    )
+
+
+def retrieve_many(mapbox_ids, session_token):
+    """
+    Retrieve several features, returning the responses in the order of ``mapbox_ids``.
+
+    Cached features are served from the cache and the rest are fetched concurrently.
+    """
+    cache = caches['mapbox']
+    cached = cache.get_many([retrieve_cache_key(mapbox_id) for mapbox_id in mapbox_ids])
+    missing = [mapbox_id for mapbox_id in dict.fromkeys(mapbox_ids) if retrieve_cache_key(mapbox_id) not in cached]
+
+    if len(missing) <= 1:
+        fetched = [retrieve(mapbox_id, session_token) for mapbox_id in missing]
+    else:
+        max_workers = min(settings.MAPBOX_MAX_CONCURRENT_REQUESTS, len(missing))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = list(executor.map(lambda mapbox_id: retrieve(mapbox_id, session_token), missing))
+
+    fetched = {retrieve_cache_key(mapbox_id): feature for mapbox_id, feature in zip(missing, fetched)}
+    # Failed lookups are returned as they are but not cached
+    cache.set_many({key: feature for key, feature in fetched.items() if feature.get('features')},
+                   settings.MAPBOX_RETRIEVE_CACHE_TTL)
+    cached.update(fetched)
+
+    return [cached[retrieve_cache_key(mapbox_id)] for mapbox_id in mapbox_ids]
+
+
+async def aretrieve_many(mapbox_ids, session_token):
+    """``retrieve_many`` for async views: the missing features are fetched concurrently on the event loop."""
+    cache = caches['mapbox']
+    cached = await cache.aget_many([retrieve_cache_key(mapbox_id) for mapbox_id in mapbox_ids])
+    missing = [mapbox_id for mapbox_id in dict.fromkeys(mapbox_ids) if retrieve_cache_key(mapbox_id) not in cached]
+
+    semaphore = asyncio.Semaphore(settings.MAPBOX_MAX_CONCURRENT_REQUESTS)
+
+    async def aretrieve(mapbox_id):
+        async with semaphore:
+            return await aget_json(retrieve_url(mapbox_id, session_token))
+
+    fetched = await asyncio.gather(*(aretrieve(mapbox_id) for mapbox_id in missing))
+
+    fetched = {retrieve_cache_key(mapbox_id): feature for mapbox_id, feature in zip(missing, fetched)}
+    await cache.aset_many({key: feature for key, feature in fetched.items() if feature.get('features')},
+                          settings.MAPBOX_RETRIEVE_CACHE_TTL)
+    cached.update(fetched)
+
+    return [cached[retrieve_cache_key(mapbox_id)] for mapbox_id in mapbox_ids]
+
+
+def retrieve_cache_key(mapbox_id):
+    return f"retrieve:{mapbox_id}"
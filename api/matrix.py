@@ -0,0 +1,226 @@
+from collections import defaultdict
+from datetime import timedelta
+
+import openrouteservice.distance_matrix
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .clients import get_ors_client
+from .geometry import haversine_distance
+from .models import TravelMatrixEntry
+
+
+class MatrixSource:
+    """
+    Computes travel durations (seconds) and distances (meters) between coordinate pairs.
+
+    ``cacheable`` sources have their results stored in ``TravelMatrixEntry`` so that later requests only
+    ask for the pairs that are not cached yet.
+    """
+
+    cacheable = True
+
+    def compute(self, locations, sources, destinations, profile):
+        """Return (durations, distances) blocks of ``len(sources)`` rows by ``len(destinations)`` columns."""
+        raise NotImplementedError
+
+
+class HaversineMatrixSource(MatrixSource):
+    """Straight-line travel model: haversine distance scaled by a detour factor at the profile's speed."""
+
+    cacheable = False
+    DEFAULT_PROFILE = 'driving-car'
+
+    def compute(self, locations, sources, destinations, profile):
+        speed_profiles = settings.LOCAL_SOLVER_SPEED_PROFILES
+        speed = speed_profiles.get(profile, speed_profiles[self.DEFAULT_PROFILE])
+        meters_per_second = speed * 1000 / 3600
+
+        detour_factor = settings.LOCAL_SOLVER_DETOUR_FACTOR
+
+        distances = [
+            [round(haversine_distance(locations[origin], locations[destination]) * detour_factor)
+             for destination in destinations]
+            for origin in sources
+        ]
+        durations = [[round(distance / meters_per_second) for distance in row] for row in distances]
+        return durations, distances
+
+
+class OpenRouteServiceMatrixSource(MatrixSource):
+    """Road network travel times from the ORS matrix endpoint, falling back to haversine for unroutable pairs."""
+
+    def compute(self, locations, sources, destinations, profile):
+        response = openrouteservice.distance_matrix.distance_matrix(
+            get_ors_client(),
+            locations=locations,
+            profile=profile,
+            sources=sources,
+            destinations=destinations,
+            metrics=['duration', 'distance'],
+            units='m',
+        )
+
+        fallback_durations, fallback_distances = HaversineMatrixSource().compute(
+            locations, sources, destinations, profile)
+        durations = [
+            [round(value) if value is not None else fallback for value, fallback in zip(row, fallback_row)]
+            for row, fallback_row in zip(response['durations'], fallback_durations)
+        ]
+        distances = [
+            [round(value) if value is not None else fallback for value, fallback in zip(row, fallback_row)]
+            for row, fallback_row in zip(response['distances'], fallback_distances)
+        ]
+        return durations, distances
+
+
+def get_matrix_source():
+    return import_string(settings.TRAVEL_MATRIX_SOURCE)()
+
+
+def round_coordinates(coordinates):
+    precision = settings.TRAVEL_MATRIX_CACHE_PRECISION
+    return round(coordinates[0], precision), round(coordinates[1], precision)
+
+
+def get_travel_matrix(locations, profile, source=None):
+    """
+    Return full (durations, distances) matrices between ``(longitude, latitude)`` locations.
+
+    Pairs are looked up in the matrix cache by coordinates rounded to ``TRAVEL_MATRIX_CACHE_PRECISION``
+    and only the missing ones are requested from the matrix source.
+    """
+    source = source or get_matrix_source()
+    if not source.cacheable:
+        all_indices = list(range(len(locations)))
+        return source.compute(locations, all_indices, all_indices, profile)
+
+    keys = [round_coordinates(location) for location in locations]
+    pairs = cached_pairs(keys, profile)
+
+    missing = [
+        (origin, destination)
+        for origin in range(len(keys)) for destination in range(len(keys))
+        if keys[origin] != keys[destination] and (keys[origin], keys[destination]) not in pairs
+    ]
+    if missing:
+        pairs.update(fetch_missing_pairs(source, keys, missing, profile))
+
+    durations = [[0] * len(keys) for _ in keys]
+    distances = [[0] * len(keys) for _ in keys]
+    for origin, origin_key in enumerate(keys):
+        for destination, destination_key in enumerate(keys):
+            if origin_key != destination_key:
+                durations[origin][destination], distances[origin][destination] = pairs[origin_key, destination_key]
+
+    return durations, distances
+
+
+def cached_pairs(keys, profile):
+    """Load the fresh cache entries between ``keys`` and mark them as recently used."""
+    latitudes = {latitude for _, latitude in keys}
+    longitudes = {longitude for longitude, _ in keys}
+    wanted = set(keys)
+
+    entries = TravelMatrixEntry.objects.filter(
+        profile=profile,
+        origin_latitude__in=latitudes,
+        origin_longitude__in=longitudes,
+        destination_latitude__in=latitudes,
+        destination_longitude__in=longitudes,
+        created_at__gte=timezone.now() - timedelta(seconds=settings.TRAVEL_MATRIX_CACHE_TTL),
+    )
+
+    pairs = {}
+    used_ids = []
+    for entry in entries:
+        origin = (entry.origin_longitude, entry.origin_latitude)
+        destination = (entry.destination_longitude, entry.destination_latitude)
+        if origin in wanted and destination in wanted:
+            pairs[origin, destination] = (entry.duration, entry.distance)
+            used_ids.append(entry.id)
+
+    if used_ids:
+        TravelMatrixEntry.objects.filter(id__in=used_ids).update(last_used_at=timezone.now())
+
+    return pairs
+
+
+def fetch_missing_pairs(source, keys, missing, profile):
+    """
+    Request the pairs of ``missing`` from the source and store them in the cache.
+
+    A few locations covering every missing pair are picked, typically the ones new to the cache, and requested
+    as rows against every location plus every other location against them as columns. A location added to N
+    cached ones thus costs 2N + 1 cells instead of the full matrix.
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    index = {key: position for position, key in enumerate(unique_keys)}
+    missing = {(index[keys[origin]], index[keys[destination]]) for origin, destination in missing}
+
+    covering = set()
+    uncovered = set(missing)
+    while uncovered:
+        counts = defaultdict(int)
+        for origin, destination in uncovered:
+            counts[origin] += 1
+            counts[destination] += 1
+        location = max(counts, key=lambda position: (counts[position], -position))
+        covering.add(location)
+        uncovered = {pair for pair in uncovered if location not in pair}
+
+    covering = sorted(covering)
+    others = [position for position in range(len(unique_keys)) if position not in covering]
+    blocks = [(covering, list(range(len(unique_keys))))]
+    if others:
+        blocks.append((others, covering))
+
+    now = timezone.now()
+    pairs = {}
+    entries = []
+    for sources, destinations in blocks:
+        durations, distances = source.compute(unique_keys, sources, destinations, profile)
+        for row, origin in enumerate(sources):
+            for column, destination in enumerate(destinations):
+                if (origin, destination) not in missing:
+                    continue
+                origin_key, destination_key = unique_keys[origin], unique_keys[destination]
+                pairs[origin_key, destination_key] = (durations[row][column], distances[row][column])
+                entries.append(TravelMatrixEntry(
+                    profile=profile,
+                    origin_longitude=origin_key[0],
+                    origin_latitude=origin_key[1],
+                    destination_longitude=destination_key[0],
+                    destination_latitude=destination_key[1],
+                    duration=durations[row][column],
+                    distance=distances[row][column],
+                    created_at=now,
+                    last_used_at=now,
+                ))
+
+    TravelMatrixEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['profile', 'origin_latitude', 'origin_longitude', 'destination_latitude',
+                       'destination_longitude'],
+        update_fields=['duration', 'distance', 'created_at', 'last_used_at'],
+    )
+    # At most once per TRAVEL_MATRIX_EVICTION_INTERVAL in each process, as it counts the whole table
+    if cache.add('travel_matrix:evicted', True, settings.TRAVEL_MATRIX_EVICTION_INTERVAL):
+        evict_matrix_entries()
+
+    return pairs
+
+
+def evict_matrix_entries():
+    """Drop expired entries, then the least recently used ones above ``TRAVEL_MATRIX_CACHE_MAX_ENTRIES``."""
+    TravelMatrixEntry.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=settings.TRAVEL_MATRIX_CACHE_TTL)
+    ).delete()
+
+    excess = TravelMatrixEntry.objects.count() - settings.TRAVEL_MATRIX_CACHE_MAX_ENTRIES
+    if excess > 0:
+        stale_ids = list(TravelMatrixEntry.objects.order_by('last_used_at', 'id').values_list('id', flat=True)[:excess])
+        TravelMatrixEntry.objects.filter(id__in=stale_ids).delete()
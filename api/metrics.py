@@ -0,0 +1,58 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_gauges = {}
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    """Record one duration sample (in seconds) for ``name``."""
+    with _lock:
+        timing = _timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+
+
+def gauge(name, value):
+    """Record the current value of ``name``, e.g. the number of pooled connections in use."""
+    with _lock:
+        _gauges[name] = value
+
+
+@contextmanager
+def timer(name):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, perf_counter() - start)
+
+
+def snapshot():
+    """Return the process-local counters, gauges and timing summaries collected so far."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'timings': {
+                name: dict(timing, average=timing['total'] / timing['count'] if timing['count'] else 0.0)
+                for name, timing in _timings.items()
+            },
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-16 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_alter_place_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelMatrixEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile', models.CharField(max_length=32)),
+                ('origin_latitude', models.FloatField()),
+                ('origin_longitude', models.FloatField()),
+                ('destination_latitude', models.FloatField()),
+                ('destination_longitude', models.FloatField()),
+                ('duration', models.PositiveIntegerField()),
+                ('distance', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='api_travelm_last_us_6fd6c3_idx')],
+                'unique_together': {('profile', 'origin_latitude', 'origin_longitude', 'destination_latitude', 'destination_longitude')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-16 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_optimizationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptimizationResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('response_data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('itinerary', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='optimization_results', to='api.itinerary')),
+                ('places', models.ManyToManyField(related_name='optimization_results', to='api.place')),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-16 20:54
+
+import math
+
+from django.db import migrations, models
+
+GRID_CELL_SIZE = 0.05
+GRID_COLUMNS = round(360 / GRID_CELL_SIZE)
+
+
+def fill_grid_cells(apps, schema_editor):
+    Place = apps.get_model('api', 'Place')
+    places = list(Place.objects.only('id', 'latitude', 'longitude'))
+    for place in places:
+        row = math.floor((place.latitude + 90) / GRID_CELL_SIZE)
+        column = math.floor((place.longitude + 180) / GRID_CELL_SIZE) % GRID_COLUMNS
+        place.grid_cell = row * GRID_COLUMNS + column
+    Place.objects.bulk_update(places, ['grid_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_optimizationresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='grid_cell',
+            field=models.BigIntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+    ]
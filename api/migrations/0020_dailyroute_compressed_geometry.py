@@ -0,0 +1,67 @@
+from django.db import migrations
+
+import api.fields
+from api.geometry import simplify_polyline
+
+# Tolerances at the time of this migration, see ROUTE_GEOMETRY_TOLERANCES
+MEDIUM_TOLERANCE = 0.0001
+LOW_TOLERANCE = 0.001
+
+
+def compress_geometries(apps, schema_editor):
+    DailyRoute = apps.get_model('api', 'DailyRoute')
+    routes = list(DailyRoute.objects.all())
+    for route in routes:
+        route.compressed_geometry = route.geometry
+        route.geometry_medium = simplify_polyline(route.geometry, MEDIUM_TOLERANCE)
+        route.geometry_low = simplify_polyline(route.geometry, LOW_TOLERANCE)
+    DailyRoute.objects.bulk_update(routes, ['compressed_geometry', 'geometry_medium', 'geometry_low'],
+                                   batch_size=500)
+
+
+def decompress_geometries(apps, schema_editor):
+    DailyRoute = apps.get_model('api', 'DailyRoute')
+    routes = list(DailyRoute.objects.all())
+    for route in routes:
+        route.geometry = route.compressed_geometry
+    DailyRoute.objects.bulk_update(routes, ['geometry'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_place_grid_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyroute',
+            name='compressed_geometry',
+            field=api.fields.CompressedPolylineField(null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyroute',
+            name='geometry_medium',
+            field=api.fields.CompressedPolylineField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='dailyroute',
+            name='geometry_low',
+            field=api.fields.CompressedPolylineField(default=b''),
+        ),
+        migrations.RunPython(compress_geometries, decompress_geometries),
+        migrations.RemoveField(
+            model_name='dailyroute',
+            name='geometry',
+        ),
+        migrations.RenameField(
+            model_name='dailyroute',
+            old_name='compressed_geometry',
+            new_name='geometry',
+        ),
+        migrations.AlterField(
+            model_name='dailyroute',
+            name='geometry',
+            field=api.fields.CompressedPolylineField(),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-16 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_dailyroute_compressed_geometry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['user', 'id'], name='itinerary_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['itinerary', 'day', 'start_time', 'id', 'place', 'duration'],
+                               name='visit_schedule_idx'),
+        ),
+    ]
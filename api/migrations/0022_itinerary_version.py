@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-16 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_schedule_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itinerary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='itinerary',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0.6 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+DEFAULT_PLACE_DURATION = 90
+DEFAULT_CATEGORY_DURATIONS = {
+    'cafe': 30,
+    'park': 60,
+    'zoo': 180,
+    'place of worship': 45,
+    'historic': 90,
+    'fast food': 30,
+    'mall': 120,
+    'shop': 60,
+    'museum': 180,
+    'stadium': 90,
+    'nature reserve': 120,
+    'art gallery': 150,
+}
+
+
+def category_names(category):
+    names = (name.strip().lower() for name in (category or '').split(','))
+    return list(dict.fromkeys(name[:100] for name in names if name))
+
+
+def precedence(name):
+    return next((index for index, key in enumerate(DEFAULT_CATEGORY_DURATIONS) if key in name),
+                len(DEFAULT_CATEGORY_DURATIONS))
+
+
+def fill_categories(apps, schema_editor):
+    Category = apps.get_model('api', 'Category')
+    Place = apps.get_model('api', 'Place')
+    places = list(Place.objects.only('id', 'category'))
+    names_by_place = {place.pk: category_names(place.category) for place in places}
+
+    names = {name for place_names in names_by_place.values() for name in place_names}
+    Category.objects.bulk_create([
+        Category(name=name, duration=next(
+            (duration for key, duration in DEFAULT_CATEGORY_DURATIONS.items() if key in name), None))
+        for name in names
+    ], ignore_conflicts=True)
+    categories = {category.name: category for category in Category.objects.all()}
+
+    for place in places:
+        durations = (categories[name].duration for name in sorted(names_by_place[place.pk], key=precedence))
+        place.duration = next((duration for duration in durations if duration is not None), DEFAULT_PLACE_DURATION)
+    Place.objects.bulk_update(places, ['duration'], batch_size=1000)
+    Place.categories.through.objects.bulk_create([
+        Place.categories.through(place_id=place.pk, category_id=categories[name].pk)
+        for place in places for name in names_by_place[place.pk]
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_itinerary_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('duration', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='duration',
+            field=models.PositiveIntegerField(default=90, editable=False),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='categories',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='places', to='api.category'),
+        ),
+        migrations.RunPython(fill_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:10
+
+from django.db import migrations
+
+
+def convert_place_lists(apps, schema_editor):
+    # Jobs queued before place ids were sent as a flat list stored [{"place_id": id}, ...]
+    OptimizationJob = apps.get_model('api', 'OptimizationJob')
+    jobs = []
+    for job in OptimizationJob.objects.only('id', 'places').iterator():
+        if any(isinstance(place, dict) for place in job.places):
+            job.places = [place['place_id'] if isinstance(place, dict) else place for place in job.places]
+            jobs.append(job)
+    OptimizationJob.objects.bulk_update(jobs, ['places'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_place_categories'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_place_lists, migrations.RunPython.noop),
+    ]
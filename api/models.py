@@ -1,5 +1,10 @@
+import math
+
+from django.conf import settings
 from django.db import models
 
+from .fields import CompressedPolylineField
+from .geometry import simplify_polyline
 from .validators import validate_longitude, validate_latitude, validate_daterange, validate_timerange
 
 
@@ -15,6 +20,15 @@ class Itinerary(models.Model):
     start_hour = models.TimeField()
     end_hour = models.TimeField()
     photo_url = models.URLField(max_length=200, blank=True, null=True)
+    # Bumped on every change of the itinerary, its visits or its daily routes; drives the ETag of its read views
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # A user's itineraries in keyset (pk) order
+            models.Index(fields=['user', 'id'], name='itinerary_user_id_idx'),
+        ]
 
     def clean(self):
         validate_daterange(self.start_date, self.end_date)
@@ -23,18 +37,126 @@ class Itinerary(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        bump_version = not self._state.adding and (update_fields is None or 'version' in update_fields)
+        if bump_version:
+            # Incremented in the database so that a concurrent visit or route change is not lost
+            self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        if bump_version:
+            self.refresh_from_db(fields=['version'])
+
     @property
     def days_count(self):
         return (self.end_date - self.start_date).days + 1
 
 
+class CategoryQuerySet(models.QuerySet):
+    def for_names(self, names):
+        """Map each of ``names`` to its Category, creating the missing ones with their default duration."""
+        names = set(names)
+        categories = {category.name: category for category in self.filter(name__in=names)}
+        missing = names - categories.keys()
+        if missing:
+            self.bulk_create([Category(name=name, duration=Category.default_duration_for(name)) for name in missing],
+                             ignore_conflicts=True)
+            categories.update((category.name, category) for category in self.filter(name__in=missing))
+        return categories
+
+
+class Category(models.Model):
+    # Duration in minutes given to new categories whose name contains the key
+    DEFAULT_DURATIONS = {
+        'cafe': 30,
+        'park': 60,
+        'zoo': 180,
+        'place of worship': 45,
+        'historic': 90,
+        'fast food': 30,
+        'mall': 120,
+        'shop': 60,
+        'museum': 180,
+        'stadium': 90,
+        'nature reserve': 120,
+        'art gallery': 150,
+    }
+
+    name = models.CharField(max_length=100, unique=True)
+    # Minutes spent at a place of the category, None to leave it to the place's other categories
+    duration = models.PositiveIntegerField(null=True, blank=True)
+
+    objects = CategoryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def default_duration_for(cls, name):
+        return next((duration for key, duration in cls.DEFAULT_DURATIONS.items() if key in name), None)
+
+    @classmethod
+    def precedence(cls, name):
+        """
+        Rank of the category among a place's categories: the position of the first ``DEFAULT_DURATIONS`` key it
+        contains, so that places keep the duration of the first key found in their category text. Categories with no
+        key come last.
+        """
+        return next((index for index, key in enumerate(cls.DEFAULT_DURATIONS) if key in name),
+                    len(cls.DEFAULT_DURATIONS))
+
+
+class PlaceQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_km):
+        """Prefilter places to the grid cells overlapping a ``radius_km`` circle around the point."""
+        return self.filter(grid_cell__in=Place.grid_cells_around(latitude, longitude, radius_km))
+
+    def by_distance(self, latitude, longitude):
+        """
+        Order places by ``distance_squared``, their squared equirectangular distance to the point in degrees of
+        latitude, which is computed by the database.
+        """
+        longitude_scale = max(math.cos(math.radians(latitude)), 0.01)
+        latitude_offset = models.F('latitude') - latitude
+        longitude_offset = (models.F('longitude') - longitude) * longitude_scale
+        return self.annotate(distance_squared=models.ExpressionWrapper(
+            latitude_offset * latitude_offset + longitude_offset * longitude_offset,
+            output_field=models.FloatField(),
+        )).order_by('distance_squared', 'pk')
+
+    def nearest(self, latitude, longitude, radius_km):
+        """
+        Places around the point, nearest first: the grid cells of ``near``, cut to ``radius_km`` by
+        ``distance_squared`` with some slack, as the equirectangular distance is approximate.
+        """
+        radius_degrees = radius_km / 111.32
+        return self.near(latitude, longitude, radius_km).by_distance(latitude, longitude).filter(
+            distance_squared__lte=(radius_degrees * 1.05) ** 2)
+
+
 class Place(models.Model):
+    # Size in degrees of the grid cells indexing places by location
+    GRID_CELL_SIZE = 0.05
+    GRID_COLUMNS = round(360 / GRID_CELL_SIZE)
+    # Duration in minutes of places none of whose categories has one
+    DEFAULT_DURATION = 90
+
     name = models.CharField(max_length=100)
     description = models.TextField()
     address = models.CharField(max_length=255)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # Comma separated category names, normalized into categories on save
     category = models.TextField()
+    categories = models.ManyToManyField(Category, related_name='places', blank=True, editable=False)
+    # Estimated visit duration in minutes, from the categories
+    duration = models.PositiveIntegerField(default=DEFAULT_DURATION, editable=False)
+    grid_cell = models.BigIntegerField(db_index=True, editable=False, null=True)
+
+    objects = PlaceQuerySet.as_manager()
 
     class Meta:
         unique_together = ('name', 'latitude', 'longitude')
@@ -42,30 +164,80 @@ class Place(models.Model):
     def __str__(self):
         return self.name
 
-    def get_estimated_duration(self):
-        default_duration = 90
+    def save(self, *args, **kwargs):
+        self.grid_cell = self.grid_cell_for(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'category' not in update_fields:
+            super().save(*args, **kwargs)
+            return
+
+        categories = Category.objects.for_names(self.category_names)
+        self.estimate_duration(categories)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'duration'}
+        super().save(*args, **kwargs)
+        self.categories.set([categories[name] for name in self.category_names])
+
+    @property
+    def category_names(self):
+        return self.parse_category(self.category)
+
+    @staticmethod
+    def parse_category(category):
+        """Normalized names of the comma separated categories, in order."""
+        names = (name.strip().lower() for name in (category or '').split(','))
+        return list(dict.fromkeys(name[:100] for name in names if name))
 
-        # Duration in minutes for each category
-        category_durations = {
-            'cafe': 30,
-            'park': 60,
-            'zoo': 180,
-            'place of worship': 45,
-            'historic': 90,
-            'fast food': 30,
-            'mall': 120,
-            'shop': 60,
-            'museum': 180,
-            'stadium': 90,
-            'nature reserve': 120,
-            'art gallery': 150,
-        }
+    def estimate_duration(self, categories):
+        """
+        Set ``duration`` from the place's category with one that comes first by ``Category.precedence``, then in the
+        place's order; ``categories`` maps their names.
+        """
+        names = sorted((name for name in self.category_names if name in categories), key=Category.precedence)
+        durations = (categories[name].duration for name in names)
+        self.duration = next((duration for duration in durations if duration is not None), self.DEFAULT_DURATION)
+        return self.duration
 
-        for key, duration in category_durations.items():
-            if key in self.category.lower():
-                return duration
+    @classmethod
+    def link_categories(cls, places, categories):
+        """Link stored places, e.g. inserted with ``bulk_create``, to their categories."""
+        through = cls.categories.through
+        through.objects.bulk_create([
+            through(place_id=place.pk, category_id=categories[name].pk)
+            for place in places for name in place.category_names
+        ], ignore_conflicts=True)
 
-        return default_duration
+    @classmethod
+    def update_durations(cls, places):
+        """Recompute the stored durations of ``places``, e.g. after a category duration was edited."""
+        changed = []
+        for place in places.prefetch_related('categories'):
+            duration = place.duration
+            categories = {category.name: category for category in place.categories.all()}
+            if place.estimate_duration(categories) != duration:
+                changed.append(place)
+        cls.objects.bulk_update(changed, ['duration'], batch_size=500)
+
+    @classmethod
+    def grid_cell_for(cls, latitude, longitude):
+        row = math.floor((float(latitude) + 90) / cls.GRID_CELL_SIZE)
+        column = math.floor((float(longitude) + 180) / cls.GRID_CELL_SIZE) % cls.GRID_COLUMNS
+        return row * cls.GRID_COLUMNS + column
+
+    @classmethod
+    def grid_cells_around(cls, latitude, longitude, radius_km):
+        latitude_radius = radius_km / 111.32
+        longitude_radius = radius_km / (111.32 * max(math.cos(math.radians(latitude)), 0.01))
+        row_span = math.ceil(latitude_radius / cls.GRID_CELL_SIZE)
+        column_span = min(math.ceil(longitude_radius / cls.GRID_CELL_SIZE), cls.GRID_COLUMNS // 2)
+
+        center = cls.grid_cell_for(latitude, longitude)
+        center_row, center_column = divmod(center, cls.GRID_COLUMNS)
+        return [
+            row * cls.GRID_COLUMNS + (center_column + column_offset) % cls.GRID_COLUMNS
+            for row in range(max(center_row - row_span, 0), center_row + row_span + 1)
+            for column_offset in range(-column_span, column_span + 1)
+        ]
 
 
 class Visit(models.Model):
@@ -79,15 +251,25 @@ class Visit(models.Model):
     class Meta:
         unique_together = ('itinerary', 'day', 'place')
         ordering = ['itinerary', 'day']
+        indexes = [
+            # An itinerary's schedule in (day, start_time, pk) order, covering every visit column
+            models.Index(fields=['itinerary', 'day', 'start_time', 'id', 'place', 'duration'],
+                         name='visit_schedule_idx'),
+        ]
 
     def __str__(self):
         return f"Day {self.day} - {self.place.name}"
 
 
 class DailyRoute(models.Model):
+    DETAIL_LEVELS = ('full', 'medium', 'low')
+
     itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='daily_routes')
     day = models.PositiveIntegerField()
-    geometry = models.TextField()
+    geometry = CompressedPolylineField()
+    # Douglas-Peucker simplifications of the geometry, see ROUTE_GEOMETRY_TOLERANCES
+    geometry_medium = CompressedPolylineField(default=b'')
+    geometry_low = CompressedPolylineField(default=b'')
 
     class Meta:
         unique_together = ('itinerary', 'day')
@@ -95,3 +277,77 @@ class DailyRoute(models.Model):
 
     def __str__(self):
         return f"Day {self.day} - {self.itinerary.title}"
+
+    def save(self, *args, **kwargs):
+        self.simplify_geometry()
+        super().save(*args, **kwargs)
+
+    def simplify_geometry(self):
+        self.geometry_medium = simplify_polyline(self.geometry, settings.ROUTE_GEOMETRY_TOLERANCES['medium'])
+        self.geometry_low = simplify_polyline(self.geometry, settings.ROUTE_GEOMETRY_TOLERANCES['low'])
+
+    def geometry_for(self, detail):
+        return self.geometry if detail == 'full' else getattr(self, f'geometry_{detail}')
+
+
+class OptimizationJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE)
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='optimization_jobs')
+    places = models.JSONField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(blank=True, null=True)
+    result_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"Optimization {self.id} - {self.itinerary.title} ({self.status})"
+
+
+class OptimizationResult(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='optimization_results')
+    places = models.ManyToManyField(Place, related_name='optimization_results')
+    response_data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Optimization result {self.key[:12]} - {self.itinerary.title}"
+
+
+class TravelMatrixEntry(models.Model):
+    profile = models.CharField(max_length=32)
+    origin_latitude = models.FloatField()
+    origin_longitude = models.FloatField()
+    destination_latitude = models.FloatField()
+    destination_longitude = models.FloatField()
+    duration = models.PositiveIntegerField()
+    distance = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('profile', 'origin_latitude', 'origin_longitude', 'destination_latitude',
+                           'destination_longitude')
+        indexes = [models.Index(fields=['last_used_at'])]
+
+    def __str__(self):
+        return (f"{self.profile}: ({self.origin_latitude}, {self.origin_longitude}) -> "
+                f"({self.destination_latitude}, {self.destination_longitude})")
@@ -0,0 +1,95 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import ItineraryStateMixin
+
+# Response headers stored along with the cached data
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def generation_key(itinerary_id):
+    return f'itinerary:{itinerary_id}:generation'
+
+
+def get_generation(cache, itinerary_id):
+    """Token included in the keys of the itinerary's cached responses, replaced on every invalidation."""
+    key = generation_key(itinerary_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def invalidate_responses(itinerary_ids):
+    """
+    Drop every cached response of the itineraries.
+
+    Only the generation keys are deleted, which works the same on every cache backend; the orphaned responses
+    expire on their own.
+    """
+    keys = [generation_key(itinerary_id) for itinerary_id in itinerary_ids]
+    if not keys:
+        return
+    cache = get_cache()
+    cache.delete_many(keys)
+    # Again once the change is visible to other connections, for responses rendered in the meantime
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedItineraryResponseMixin(ItineraryStateMixin):
+    """
+    Cache the successful responses of views rendering the data of one itinerary, per itinerary and user.
+
+    The generation is read before the response is rendered, so a response racing with an invalidation is stored
+    under the old generation and never served. An invalidation made by another process does not reach a
+    per-process (locmem) cache, so with one the keys also include the itinerary's version, read from the database
+    on every request; with a shared cache, hits run no query.
+    """
+
+    def cached_response(self, request, itinerary_id, render, *variant):
+        try:
+            itinerary_id = int(itinerary_id)
+        except (TypeError, ValueError):
+            return render()
+
+        cache = get_cache()
+        version = None
+        if isinstance(cache, LocMemCache):
+            state = self.itinerary_state(itinerary_id)
+            if state is None:
+                return render()
+            version = state[0]
+
+        generation = get_generation(cache, itinerary_id)
+        key = ':'.join(str(part) for part in (
+            'itinerary', itinerary_id, version, generation, request.user.pk, type(self).__name__, *variant))
+
+        entry = cache.get(key)
+        if entry is None:
+            response = render()
+            if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                cache.set(key, (response.data, headers), settings.RESPONSE_CACHE_TTL)
+            return response
+
+        data, headers = entry
+        not_modified = get_conditional_response(
+            request, etag=headers.get('ETag'), last_modified=parse_http_date_safe(headers.get('Last-Modified', '')))
+        response = not_modified or Response(data, status=status.HTTP_200_OK)
+        for header, value in headers.items():
+            response[header] = value
+        return response
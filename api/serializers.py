@@ -2,7 +2,7 @@ from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Itinerary, Place, Visit, DailyRoute
+from .models import Itinerary, Place, Visit, DailyRoute, OptimizationJob
 from .validators import validate_longitude, validate_latitude, validate_daterange, validate_timerange
 
 
@@ -52,7 +52,7 @@ class ItinerarySerializer(serializers.ModelSerializer):
 class PlaceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Place
-        fields = '__all__'
+        exclude = ['grid_cell', 'categories']
 
 
 class VisitSerializer(serializers.ModelSerializer):
@@ -75,16 +75,44 @@ class PlaceIdSerializer(serializers.Serializer):
     place_id = serializers.IntegerField()
 
 
+class PlaceIdListField(serializers.ListField):
+    """Flat list of place ids; plain JSON int lists skip the per-item child validation."""
+    child = serializers.IntegerField()
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and all(type(item) is int for item in data):
+            return data
+        return super().to_internal_value(data)
+
+
 class OptimizeRouteSerializer(serializers.Serializer):
     itinerary_id = serializers.IntegerField()
     places = serializers.ListField(
-        child=PlaceIdSerializer()
+        child=PlaceIdSerializer(),
+        required=False
     )
+    place_ids = PlaceIdListField(required=False)
+
+    def validate(self, attrs):
+        if ('places' in attrs) == ('place_ids' in attrs):
+            raise serializers.ValidationError("Provide either 'places' or 'place_ids'.")
+        if 'places' in attrs:
+            attrs['place_ids'] = [place['place_id'] for place in attrs.pop('places')]
+        return attrs
+
+
+class OptimizationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OptimizationJob
+        fields = ['id', 'itinerary', 'status', 'result', 'result_status', 'error', 'created_at', 'started_at',
+                  'finished_at']
+        read_only_fields = fields
 
 
 class DailyRouteSerializer(serializers.ModelSerializer):
     itinerary = serializers.PrimaryKeyRelatedField(queryset=Itinerary.objects.all())
     day = serializers.IntegerField()
+    geometry = serializers.CharField()
 
     class Meta:
         model = DailyRoute
@@ -100,3 +128,10 @@ class DailyRouteSerializer(serializers.ModelSerializer):
         if DailyRoute.objects.filter(itinerary=itinerary, day=day).exists():
             raise serializers.ValidationError(f"A daily route with itinerary {itinerary} and day {day} already exists.")
         return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        detail = self.context.get('detail', 'full')
+        if detail != 'full':
+            data['geometry'] = instance.geometry_for(detail)
+        return data
@@ -0,0 +1,95 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import invalidate_cached_user
+from .models import Category, Itinerary, Place, Visit, DailyRoute, OptimizationResult
+from .response_cache import invalidate_responses
+
+_batch = threading.local()
+
+
+@contextmanager
+def batched_invalidation():
+    """
+    Collect the itineraries invalidated by row-level signals inside the block and invalidate them once on exit.
+
+    Bulk write paths use this so that their query count does not grow with the number of rows they touch.
+    Bulk inserts and updates send no signals, so these paths call ``invalidate_itineraries`` themselves.
+    """
+    if getattr(_batch, 'itinerary_ids', None) is not None:
+        yield
+        return
+
+    _batch.itinerary_ids = set()
+    try:
+        yield
+        itinerary_ids = _batch.itinerary_ids
+    finally:
+        _batch.itinerary_ids = None
+
+    if itinerary_ids:
+        invalidate_itineraries(itinerary_ids)
+
+
+def invalidate_itineraries(itinerary_ids):
+    pending = getattr(_batch, 'itinerary_ids', None)
+    if pending is not None:
+        pending.update(itinerary_ids)
+        return
+
+    OptimizationResult.objects.filter(itinerary_id__in=itinerary_ids).delete()
+    bump_versions(Itinerary.objects.filter(pk__in=itinerary_ids))
+    invalidate_responses(itinerary_ids)
+
+
+def bump_versions(itineraries):
+    itineraries.update(version=F('version') + 1, updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Itinerary)
+def invalidate_itinerary_results(sender, instance, **kwargs):
+    # Itinerary.save bumps its own version
+    OptimizationResult.objects.filter(itinerary_id=instance.pk).delete()
+    invalidate_responses({instance.pk})
+
+
+@receiver(post_delete, sender=Itinerary)
+def invalidate_deleted_itinerary(sender, instance, **kwargs):
+    invalidate_responses({instance.pk})
+
+
+@receiver([post_save, post_delete], sender=Visit)
+@receiver([post_save, post_delete], sender=DailyRoute)
+def invalidate_plan_results(sender, instance, **kwargs):
+    # A stored plan edited by hand no longer matches the cached optimization output
+    invalidate_itineraries({instance.itinerary_id})
+
+
+@receiver([post_save, pre_delete], sender=Place)
+def invalidate_place_results(sender, instance, created=False, **kwargs):
+    # pre_delete, as the many-to-many links are already gone once the place is deleted
+    OptimizationResult.objects.filter(places=instance).delete()
+    if kwargs['signal'] is post_save and not created:
+        # Visit lists show the place name and location; deleted places cascade to their visits instead
+        itinerary_ids = set(instance.visits.values_list('itinerary_id', flat=True))
+        if itinerary_ids:
+            bump_versions(Itinerary.objects.filter(pk__in=itinerary_ids))
+            invalidate_responses(itinerary_ids)
+
+
+@receiver(post_save, sender=Category)
+def update_category_durations(sender, instance, created, **kwargs):
+    if not created:
+        Place.update_durations(instance.places.all())
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    # Covers deactivations, password changes and last_login updates
+    invalidate_cached_user(instance.pk)
@@ -0,0 +1,235 @@
+import openrouteservice.optimization
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .clients import get_async_ors_client, get_ors_client
+from .geometry import encode_polyline
+from .matrix import get_travel_matrix
+
+
+def get_route_solver():
+    """Instantiate the solver backend configured in ``ROUTE_SOLVER_BACKEND``."""
+    return import_string(settings.ROUTE_SOLVER_BACKEND)()
+
+
+class RouteSolver:
+    """
+    Base class for route optimization backends.
+
+    ``solve`` receives the ORS ``Job`` and ``Vehicle`` objects built by ``OptimizeRouteView`` and returns
+    a result shaped like the ORS optimization response (``routes`` with ``steps``, and ``unassigned``).
+    """
+
+    def solve(self, jobs, vehicles):
+        raise NotImplementedError
+
+    async def asolve(self, jobs, vehicles):
+        """``solve`` for async views; backends without native async support run ``solve`` in a worker thread."""
+        return await sync_to_async(self.solve_in_thread, thread_sensitive=False)(jobs, vehicles)
+
+    def solve_in_thread(self, jobs, vehicles):
+        try:
+            return self.solve(jobs, vehicles)
+        finally:
+            # Solvers may query the matrix cache; drop the connection opened by this worker thread
+            connections.close_all()
+
+
+class OpenRouteServiceSolver(RouteSolver):
+    def solve(self, jobs, vehicles):
+        return openrouteservice.optimization.optimization(
+            get_ors_client(),
+            jobs=jobs,
+            vehicles=vehicles,
+            geometry=True
+        )
+
+    async def asolve(self, jobs, vehicles):
+        # The request body built by openrouteservice.optimization.optimization
+        params = {'vehicles': [vehicle.__dict__ for vehicle in vehicles], 'options': {'g': True}}
+        if jobs:
+            params['jobs'] = [job.__dict__ for job in jobs]
+        return await get_async_ors_client().request('/optimization', params)
+
+
+class LocalRouteSolver(RouteSolver):
+    """
+    In-process solver; with the default haversine travel matrix it needs no network access.
+
+    Travel times come from ``api.matrix.get_travel_matrix``. Routes are built one vehicle at a time by
+    repeatedly appending the job that can be served earliest, then improved with 2-opt moves that keep
+    every time window satisfied.
+    """
+
+    DEFAULT_PROFILE = 'driving-car'
+
+    def solve(self, jobs, vehicles):
+        locations = []
+        location_index = {}
+
+        def index_of(coordinates):
+            key = tuple(coordinates)
+            if key not in location_index:
+                location_index[key] = len(locations)
+                locations.append(key)
+            return location_index[key]
+
+        for vehicle in vehicles:
+            index_of(vehicle.start)
+            index_of(vehicle.end)
+        for job in jobs:
+            index_of(job.location)
+
+        profiles = {getattr(vehicle, 'profile', self.DEFAULT_PROFILE) for vehicle in vehicles}
+        matrices = {profile: get_travel_matrix(locations, profile) for profile in profiles}
+
+        remaining = list(jobs)
+        routes = []
+
+        for vehicle in vehicles:
+            durations, distances = matrices[getattr(vehicle, 'profile', self.DEFAULT_PROFILE)]
+            context = (vehicle, index_of, durations, distances)
+
+            sequence = self.build_route(context, remaining)
+            if not sequence:
+                continue
+
+            sequence = self.improve_route(context, sequence)
+            routes.append(self.route_payload(context, sequence))
+            assigned = {job.id for job in sequence}
+            remaining = [job for job in remaining if job.id not in assigned]
+
+        unassigned = [{'id': job.id, 'location': list(job.location), 'type': 'job'} for job in remaining]
+
+        return {
+            'code': 0,
+            'summary': {
+                'cost': sum(route['cost'] for route in routes),
+                'routes': len(routes),
+                'unassigned': len(unassigned),
+                'service': sum(route['service'] for route in routes),
+                'duration': sum(route['duration'] for route in routes),
+                'waiting_time': sum(route['waiting_time'] for route in routes),
+                'distance': sum(route['distance'] for route in routes),
+            },
+            'unassigned': unassigned,
+            'routes': routes,
+        }
+
+    @staticmethod
+    def schedule(context, sequence):
+        """Simulate ``sequence`` for the vehicle, returning its steps or None when a time window is violated."""
+        vehicle, index_of, durations, distances = context
+        day_start, day_end = getattr(vehicle, 'time_window', (0, float('inf')))
+
+        position = index_of(vehicle.start)
+        current_time = day_start
+        travelled = distance = 0
+        steps = [{
+            'type': 'start',
+            'location': list(vehicle.start),
+            'arrival': current_time,
+            'duration': 0,
+            'distance': 0,
+        }]
+
+        for job in sequence:
+            target = index_of(job.location)
+            travelled += durations[position][target]
+            distance += distances[position][target]
+            arrival = current_time + durations[position][target]
+
+            service_start = None
+            for window_start, window_end in getattr(job, 'time_windows', None) or [(0, float('inf'))]:
+                if arrival <= window_end:
+                    service_start = max(arrival, window_start)
+                    break
+            if service_start is None:
+                return None
+
+            service = getattr(job, 'service', 0)
+            steps.append({
+                'type': 'job',
+                'job': job.id,
+                'location': list(job.location),
+                'arrival': arrival,
+                'duration': travelled,
+                'service': service,
+                'waiting_time': service_start - arrival,
+                'distance': distance,
+            })
+            current_time = service_start + service
+            position = target
+
+        end = index_of(vehicle.end)
+        travelled += durations[position][end]
+        distance += distances[position][end]
+        arrival = current_time + durations[position][end]
+        if arrival > day_end:
+            return None
+
+        steps.append({
+            'type': 'end',
+            'location': list(vehicle.end),
+            'arrival': arrival,
+            'duration': travelled,
+            'distance': distance,
+        })
+        return steps
+
+    def build_route(self, context, jobs):
+        sequence = []
+        candidates = list(jobs)
+
+        while candidates:
+            best = None
+            for job in candidates:
+                steps = self.schedule(context, sequence + [job])
+                if steps is None:
+                    continue
+                job_step = steps[-2]
+                key = (job_step['arrival'] + job_step['waiting_time'], steps[-1]['duration'])
+                if best is None or key < best[0]:
+                    best = (key, job)
+
+            if best is None:
+                break
+
+            sequence.append(best[1])
+            candidates.remove(best[1])
+
+        return sequence
+
+    def improve_route(self, context, sequence):
+        best_steps = self.schedule(context, sequence)
+        improved = True
+
+        while improved:
+            improved = False
+            for i in range(len(sequence) - 1):
+                for j in range(i + 2, len(sequence) + 1):
+                    candidate = sequence[:i] + sequence[i:j][::-1] + sequence[j:]
+                    steps = self.schedule(context, candidate)
+                    if steps is not None and steps[-1]['duration'] < best_steps[-1]['duration']:
+                        sequence, best_steps = candidate, steps
+                        improved = True
+
+        return sequence
+
+    def route_payload(self, context, sequence):
+        vehicle = context[0]
+        steps = self.schedule(context, sequence)
+        travel_time = steps[-1]['duration']
+
+        return {
+            'vehicle': vehicle.id,
+            'cost': travel_time,
+            'service': sum(step.get('service', 0) for step in steps),
+            'duration': travel_time,
+            'waiting_time': sum(step.get('waiting_time', 0) for step in steps),
+            'distance': steps[-1]['distance'],
+            'steps': steps,
+            'geometry': encode_polyline([step['location'] for step in steps]),
+        }
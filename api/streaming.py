@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+class StreamingListMixin:
+    """
+    Serve list responses as a JSON stream with ``?stream=1``.
+
+    Items are serialized one at a time while the queryset is read in ``STREAMING_CHUNK_SIZE`` chunks, so memory
+    stays flat whatever the size of the list. The body is identical to the one rendered by ``JSONRenderer``.
+    """
+
+    def stream_requested(self):
+        return self.request.query_params.get('stream') in ('1', 'true')
+
+    def streaming_response(self, queryset, prefix=b'', suffix=b''):
+        renderer = JSONRenderer()
+        # Views with a ValuesSerializer stream .values() rows instead of model instances
+        values_serializer = getattr(self, 'values_serializer', None)
+        if values_serializer is not None:
+            serializer, queryset = values_serializer, values_serializer.values(queryset)
+        else:
+            serializer = self.get_serializer()
+
+        def chunks():
+            yield prefix + b'['
+            for position, instance in enumerate(queryset.iterator(chunk_size=settings.STREAMING_CHUNK_SIZE)):
+                item = renderer.render(serializer.to_representation(instance))
+                yield b',' + item if position else item
+            yield b']' + suffix
+
+        return StreamingHttpResponse(chunks(), content_type=renderer.media_type)
@@ -1,28 +1,67 @@
+import asyncio
+import json
 import os
+import threading
 import uuid
+from io import StringIO
 from datetime import date, time
+from importlib import import_module
+from unittest import mock
 
 import django
+import httpx
+import openrouteservice.optimization
 import pytest
+import requests
 from django.contrib.auth.models import User
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.test import RequestFactory
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import force_authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from api.models import Itinerary, DailyRoute, Place, Visit
+from api import mapbox, metrics
+from api.authentication import user_cache_key
+from api.clients import AsyncORSClient, PooledORSClient
+from api.clustering import sweep_partition
+from api.db.pool import ConnectionPool, PoolTimeout
+from api.db.postgresql_pool.base import DatabaseWrapper as PooledDatabaseWrapper
+from api.geometry import encode_polyline, pack_polyline, unpack_polyline, simplify_polyline
+from api.jobs import claim_next_job
+from api.matrix import MatrixSource, get_travel_matrix
+from api.models import Category, Itinerary, DailyRoute, Place, Visit, TravelMatrixEntry, OptimizationJob, \
+    OptimizationResult
+from api.response_cache import generation_key
+from api.solvers import LocalRouteSolver
 from api.serializers import DailyRouteSerializer, VisitSerializer, PlaceSerializer, ItinerarySerializer, \
-    MyTokenObtainPairSerializer, UserSerializer
+    MyTokenObtainPairSerializer, UserSerializer, OptimizeRouteSerializer
 from api.validators import validate_longitude, validate_latitude, validate_daterange, validate_timerange
-from api.views import RegisterView, MyTokenObtainPairView, ItineraryViewSet
+from api.values import ValuesSerializer
+from api.views import RegisterView, MyTokenObtainPairView, ItineraryViewSet, OptimizeRouteView, OptimizationJobView, \
+    DailyRouteDetailView, ItineraryVisitsView, PlaceViewSet, VisitViewSet, AsyncOptimizeRouteView
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_project.settings')
 django.setup()
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Rolled back test databases hand out the same ids again
+    caches['responses'].clear()
+    caches['default'].clear()
+
+
 @pytest.fixture
 @pytest.mark.django_db
 def user(request):
@@ -214,7 +253,70 @@ def test_place_unique_constraint():
 
 @pytest.mark.django_db
 def test_place_estimated_duration(place):
-    assert place.get_estimated_duration() == 180
+    assert place.duration == 180
+
+
+@pytest.mark.django_db
+def test_place_categories():
+    place = Place.objects.create(name='Corner', description='', address='', latitude=0.0, longitude=0.0,
+                                 category='Food_and_drink, cafe,food_and_drink')
+    assert place.category_names == ['food_and_drink', 'cafe']
+    assert sorted(place.categories.values_list('name', flat=True)) == ['cafe', 'food_and_drink']
+    assert place.duration == 30
+
+    other = Place.objects.create(name='Other', description='', address='', latitude=1.0, longitude=1.0,
+                                 category='food_and_drink')
+    assert other.duration == Place.DEFAULT_DURATION
+
+    food = Category.objects.get(name='food_and_drink')
+    food.duration = 45
+    food.save()
+    place.refresh_from_db()
+    other.refresh_from_db()
+    # The cafe category still comes first for the place
+    assert (place.duration, other.duration) == (30, 45)
+
+    other.category = 'park'
+    other.save(update_fields=['category'])
+    other.refresh_from_db()
+    assert other.duration == 60
+    assert list(other.categories.values_list('name', flat=True)) == ['park']
+
+
+@pytest.mark.django_db
+def test_place_duration_follows_default_durations_order():
+    def duration(category, name):
+        return Place.objects.create(name=name, description='', address='', latitude=0.0, longitude=0.0,
+                                    category=category).duration
+
+    # 'cafe' comes before 'museum' in Category.DEFAULT_DURATIONS, whatever the order of the place's categories
+    assert duration('museum,cafe', 'Museum cafe') == 30
+    assert duration('cafe,museum', 'Cafe museum') == 30
+    assert duration('food_and_drink,art gallery', 'Gallery') == 150
+
+    Category.objects.filter(name='cafe').update(duration=None)
+    assert duration('museum,cafe', 'Museum cafe 2') == 180
+
+    # The backfill of existing places picks the same category
+    Category.objects.filter(name='cafe').update(duration=30)
+    Place.objects.update(duration=Place.DEFAULT_DURATION)
+    import_module('api.migrations.0023_place_categories').fill_categories(django_apps, None)
+    assert Place.objects.get(name='Museum cafe 2').duration == 30
+
+
+@pytest.mark.django_db
+def test_place_list_filters_by_category(user):
+    museum = Place.objects.create(name='Museum', description='', address='', latitude=0.0, longitude=0.0,
+                                  category='museum,tourist_attraction')
+    Place.objects.create(name='Park', description='', address='', latitude=1.0, longitude=1.0, category='park')
+    view = PlaceViewSet.as_view({'get': 'list'})
+
+    request = RequestFactory().get('/api/places/', {'category': 'Museum'})
+    force_authenticate(request, user=user)
+    response = view(request)
+    assert response.status_code == status.HTTP_200_OK
+    assert [row['id'] for row in response.data['results']] == [museum.id]
+    assert response.data['results'][0]['duration'] == 180
 
 
 # Visit Model Tests
@@ -545,3 +647,1168 @@ def test_itinerary_view_set(authenticated_user, create_itinerary):
 
     response = view(request)
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.fixture
+def optimize_places():
+    return [
+        Place.objects.create(name=f'Place {idx}', description='', address='', latitude=0.01 * idx,
+                             longitude=0.01 * idx, category='museum')
+        for idx in range(12)
+    ]
+
+
+def fake_optimize_segment(view, itinerary, places, durations, days_count):
+    routes = [
+        {
+            'vehicle': vehicle,
+            'geometry': f'geometry-{places[0].name}-{vehicle}',
+            'steps': [
+                {'type': 'start', 'arrival': 32400},
+                *[{'type': 'job', 'job': job, 'arrival': 32400 + 3600 * step}
+                  for step, job in enumerate(range(vehicle, len(places), days_count))],
+                {'type': 'end', 'arrival': 64800},
+            ],
+        } for vehicle in range(days_count)
+    ]
+    return {'routes': routes, 'unassigned': []}, 0
+
+
+@pytest.mark.django_db
+def test_optimize_route_view_runs_segments_concurrently(settings, authenticated_user, create_itinerary,
+                                                         optimize_places):
+    settings.OPTIMIZATION_MAX_WORKERS = 4
+    barrier = threading.Barrier(4, timeout=5)
+
+    def optimize_segment(view, *args):
+        # Every segment has to be in flight at the same time for the barrier to release
+        barrier.wait()
+        return fake_optimize_segment(view, *args)
+
+    factory = RequestFactory()
+    request = factory.post('/api/optimize-route/', {
+        'itinerary_id': create_itinerary.id,
+        'places': [{'place_id': place.id} for place in optimize_places],
+    }, content_type='application/json')
+    force_authenticate(request, user=authenticated_user)
+
+    with mock.patch.object(OptimizeRouteView, 'optimize_segment', optimize_segment), \
+            mock.patch.object(OptimizeRouteView, 'fetch_additional_places', return_value=([], [])):
+        response = OptimizeRouteView.as_view()(request)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['status'] == 0
+    assert [day['day'] for day in response.data['days']] == list(range(1, 11))
+    assert response.data['days'][0]['geometry'] == 'geometry-Place 0-0'
+    assert response.data['days'][3]['geometry'] == 'geometry-Place 4-0'
+    assert response.data['days'][9]['geometry'] == 'geometry-Place 11-0'
+    assert Visit.objects.filter(itinerary=create_itinerary).count() == len(optimize_places)
+
+
+def test_local_route_solver_builds_ors_shaped_routes():
+    vehicles = [
+        openrouteservice.optimization.Vehicle(id=day, start=(17.03, 51.11), end=(17.03, 51.11),
+                                              time_window=[9 * 3600, 18 * 3600])
+        for day in range(2)
+    ]
+    jobs = [
+        openrouteservice.optimization.Job(id=idx, location=(17.03 + 0.01 * idx, 51.11), service=180 * 60)
+        for idx in range(4)
+    ]
+
+    result = LocalRouteSolver().solve(jobs, vehicles)
+
+    assert result['unassigned'] == []
+    assert {route['vehicle'] for route in result['routes']} == {0, 1}
+    served = [step['job'] for route in result['routes'] for step in route['steps'] if step['type'] == 'job']
+    assert sorted(served) == list(range(4))
+    for route in result['routes']:
+        assert route['steps'][0]['type'] == 'start'
+        assert route['steps'][-1]['type'] == 'end'
+        assert route['steps'][-1]['arrival'] <= 18 * 3600
+        assert len(openrouteservice.convert.decode_polyline(route['geometry'])['coordinates']) == len(route['steps'])
+
+
+def test_local_route_solver_respects_time_windows():
+    vehicles = [openrouteservice.optimization.Vehicle(id=0, start=(0.0, 0.0), end=(0.0, 0.0),
+                                                      time_window=[9 * 3600, 12 * 3600])]
+    jobs = [
+        openrouteservice.optimization.Job(id=0, location=(0.001, 0.0), service=1800,
+                                          time_windows=[[11 * 3600, 12 * 3600]]),
+        openrouteservice.optimization.Job(id=1, location=(0.002, 0.0), service=1800),
+        openrouteservice.optimization.Job(id=2, location=(0.003, 0.0), service=4 * 3600),
+    ]
+
+    result = LocalRouteSolver().solve(jobs, vehicles)
+
+    steps = {step['job']: step for step in result['routes'][0]['steps'] if step['type'] == 'job'}
+    assert steps[0]['arrival'] + steps[0]['waiting_time'] >= 11 * 3600
+    assert [job['id'] for job in result['unassigned']] == [2]
+
+
+class CountingMatrixSource(MatrixSource):
+    def __init__(self):
+        self.requested = []
+
+    def compute(self, locations, sources, destinations, profile):
+        self.requested.append((len(sources), len(destinations)))
+        durations = [[10 * origin + destination for destination in destinations] for origin in sources]
+        return durations, durations
+
+
+@pytest.mark.django_db
+def test_travel_matrix_cache_only_requests_missing_pairs():
+    locations = [(17.03, 51.11), (17.04, 51.12), (17.05, 51.13)]
+    source = CountingMatrixSource()
+
+    durations, distances = get_travel_matrix(locations, 'driving-car', source)
+    assert durations[0][1] == 1 and durations[2][1] == 21 and durations[1][1] == 0
+    assert TravelMatrixEntry.objects.count() == 6
+
+    source.requested.clear()
+    cached_durations, _ = get_travel_matrix([(17.030001, 51.110001)] + locations[1:], 'driving-car', source)
+    assert source.requested == []
+    assert cached_durations == durations
+
+    cached_at = dict(TravelMatrixEntry.objects.values_list('id', 'created_at'))
+    durations, _ = get_travel_matrix(locations + [(17.06, 51.14)], 'driving-car', source)
+    # The new location against all of them, then the others against it
+    assert source.requested == [(1, 4), (3, 1)]
+    assert durations[3][0] == 30 and durations[0][3] == 3
+    assert TravelMatrixEntry.objects.count() == 12
+    assert dict(TravelMatrixEntry.objects.filter(id__in=cached_at).values_list('id', 'created_at')) == cached_at
+
+
+@pytest.mark.django_db
+def test_travel_matrix_cache_evicts_least_recently_used(settings):
+    settings.TRAVEL_MATRIX_CACHE_MAX_ENTRIES = 2
+    get_travel_matrix([(0.0, 0.0), (0.1, 0.1), (0.2, 0.2)], 'driving-car', CountingMatrixSource())
+    assert TravelMatrixEntry.objects.count() == 2
+
+
+def test_sweep_partition_groups_places_by_direction():
+    # Three places in each compass direction, listed interleaved so contiguous slicing would mix them
+    directions = [(0.0, 1.0), (1.0, 0.0), (0.0, -1.0), (-1.0, 0.0)]
+    coordinates = [(dx * distance, dy * distance) for distance in (0.01, 0.02, 0.03) for dx, dy in directions]
+
+    groups = sweep_partition((0.0, 0.0), coordinates, [60] * len(coordinates), [3, 3, 3, 3])
+
+    assert sorted(index for group in groups for index in group) == list(range(len(coordinates)))
+    for group in groups:
+        assert len(group) == 3
+        assert len({index % len(directions) for index in group}) == 1
+
+
+def test_sweep_partition_keeps_empty_groups_aligned_with_capacities():
+    coordinates = [(0.01, 0.0), (0.01, 0.002), (0.01, 0.004)]
+
+    # The heavy middle place covers the share of the third group too, which stays empty
+    assert sweep_partition((0.0, 0.0), coordinates, [10, 200, 10], [3, 3, 3, 1]) == [[0], [1], [], [2]]
+
+
+@pytest.mark.django_db
+def test_plan_segments_drops_empty_segments_with_their_days(create_itinerary):
+    itinerary = create_itinerary
+    itinerary.start_place_longitude, itinerary.start_place_latitude = 0.0, 0.0
+    places = [Place(name=f'Place {idx}', latitude=0.002 * idx, longitude=0.01) for idx in range(3)]
+
+    days_count, segments, _, segment_days, segment_offsets = OptimizeRouteView().plan_segments(
+        itinerary, places, [10, 200, 10])
+
+    assert days_count == 10
+    assert segments == [[places[0]], [places[1]], [places[2]]]
+    # The last place belongs to the 1-day tail segment starting on day 10, not to days 7-9
+    assert segment_days == [3, 3, 1]
+    assert segment_offsets == [0, 3, 9]
+
+
+@pytest.mark.django_db
+def test_optimize_route_without_places_keeps_the_stored_plan(authenticated_user, create_itinerary, optimize_places):
+    Visit.objects.create(itinerary=create_itinerary, place=optimize_places[0], day=1, duration=60, start_time=time(9))
+    DailyRoute.objects.create(itinerary=create_itinerary, day=1, geometry='')
+    body = {'itinerary_id': create_itinerary.id, 'place_ids': []}
+
+    def post(view):
+        request = RequestFactory().post('/api/optimize-route/', body, content_type='application/json',
+                                        headers={'Authorization': f'Bearer {authenticated_user.access_token}'})
+        return async_to_sync(view)(request) if view.view_class.view_is_async else view(request)
+
+    # Neither the stored places nor Mapbox add any
+    with mock.patch.object(OptimizeRouteView, 'ensure_minimum_duration', return_value=([], [])), \
+            mock.patch.object(OptimizeRouteView, 'aensure_minimum_duration', return_value=([], [])), \
+            mock.patch.object(OptimizeRouteView, 'optimize_segment') as optimize_segment, \
+            mock.patch.object(OptimizeRouteView, 'aoptimize_segment') as aoptimize_segment:
+        for view in [OptimizeRouteView.as_view(), AsyncOptimizeRouteView.as_view()]:
+            assert post(view).status_code == status.HTTP_400_BAD_REQUEST
+
+    optimize_segment.assert_not_called()
+    aoptimize_segment.assert_not_called()
+    assert Visit.objects.filter(itinerary=create_itinerary).count() == 1
+    assert DailyRoute.objects.filter(itinerary=create_itinerary).count() == 1
+
+
+def test_sweep_partition_sizes_groups_by_capacity():
+    coordinates = [(0.01 * idx, 0.01) for idx in range(-5, 5)]
+
+    groups = sweep_partition((0.0, 0.0), coordinates, [60] * len(coordinates), [3, 1])
+
+    assert [len(group) for group in groups] == [8, 2]
+
+
+@pytest.mark.django_db
+def test_optimize_route_async_job(authenticated_user, create_itinerary, optimize_places):
+    factory = RequestFactory()
+    request = factory.post('/api/optimize-route/?async=1', {
+        'itinerary_id': create_itinerary.id,
+        'places': [{'place_id': place.id} for place in optimize_places],
+    }, content_type='application/json')
+    force_authenticate(request, user=authenticated_user)
+
+    response = OptimizeRouteView.as_view()(request)
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.data['status'] == OptimizationJob.STATUS_PENDING
+    job_id = response.data['job_id']
+    assert Visit.objects.filter(itinerary=create_itinerary).count() == 0
+
+    with mock.patch.object(OptimizeRouteView, 'optimize_segment', fake_optimize_segment), \
+            mock.patch.object(OptimizeRouteView, 'fetch_additional_places', return_value=([], [])):
+        call_command('run_optimization_worker', '--once', stdout=mock.MagicMock())
+
+    request = factory.get(f'/api/optimize-route/{job_id}/')
+    force_authenticate(request, user=authenticated_user)
+    response = OptimizationJobView.as_view()(request, job_id=job_id)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['status'] == OptimizationJob.STATUS_SUCCEEDED
+    assert response.data['result_status'] == status.HTTP_200_OK
+    assert len(response.data['result']['days']) == create_itinerary.days_count
+    assert Visit.objects.filter(itinerary=create_itinerary).count() == len(optimize_places)
+
+
+@pytest.mark.django_db
+def test_optimization_job_is_claimed_once(authenticated_user, create_itinerary):
+    OptimizationJob.objects.create(user=authenticated_user, itinerary=create_itinerary, places=[])
+
+    assert claim_next_job().status == OptimizationJob.STATUS_RUNNING
+    assert claim_next_job() is None
+
+
+@pytest.mark.django_db
+def test_legacy_optimization_jobs_are_converted_to_place_ids(authenticated_user, create_itinerary):
+    migration = import_module('api.migrations.0024_optimizationjob_place_ids')
+    legacy = OptimizationJob.objects.create(user=authenticated_user, itinerary=create_itinerary,
+                                            places=[{'place_id': 3}, {'place_id': 1}])
+    current = OptimizationJob.objects.create(user=authenticated_user, itinerary=create_itinerary, places=[2])
+
+    migration.convert_place_lists(django_apps, None)
+
+    legacy.refresh_from_db()
+    current.refresh_from_db()
+    assert (legacy.places, current.places) == ([3, 1], [2])
+
+
+@pytest.mark.django_db
+def test_optimize_route_reuses_cached_result(authenticated_user, create_itinerary, optimize_places):
+    factory = RequestFactory()
+    payload = {
+        'itinerary_id': create_itinerary.id,
+        'places': [{'place_id': place.id} for place in optimize_places],
+    }
+
+    def optimize():
+        request = factory.post('/api/optimize-route/', payload, content_type='application/json')
+        force_authenticate(request, user=authenticated_user)
+        return OptimizeRouteView.as_view()(request)
+
+    with mock.patch.object(OptimizeRouteView, 'optimize_segment', autospec=True,
+                           side_effect=fake_optimize_segment) as optimize_segment, \
+            mock.patch.object(OptimizeRouteView, 'fetch_additional_places', return_value=([], [])):
+        first = optimize()
+        calls = optimize_segment.call_count
+        second = optimize()
+        assert optimize_segment.call_count == calls
+        assert second.data == dict(first.data, changed_days=[])
+
+        optimize_places[0].description = 'Updated'
+        optimize_places[0].save()
+        optimize()
+        assert optimize_segment.call_count == 2 * calls
+
+
+def ors_response(status_code, body='{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body.encode()
+    response.request = requests.Request('POST', 'https://api.openrouteservice.org/optimization').prepare()
+    return response
+
+
+def test_pooled_ors_client_retries_throttled_requests():
+    metrics.reset()
+    client = PooledORSClient(key='key', pool_size=4, max_retries=3, backoff_base=0.5, backoff_max=8)
+
+    with mock.patch.object(client._session, 'post', side_effect=[
+        ors_response(429), ors_response(502), ors_response(200, '{"routes": []}')
+    ]) as post, mock.patch('api.clients.time.sleep') as sleep:
+        result = client.request('/optimization', {}, post_json={'jobs': []})
+
+    assert result == {'routes': []}
+    assert post.call_count == 3
+    assert sleep.call_count == 2
+    assert 0.25 <= sleep.call_args_list[0].args[0] <= 0.75
+    assert 0.5 <= sleep.call_args_list[1].args[0] <= 1.5
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['ors.retries'] == 2
+    assert snapshot['timings']['ors.latency']['count'] == 3
+
+
+def test_pooled_ors_client_gives_up_after_max_retries():
+    client = PooledORSClient(key='key', pool_size=4, max_retries=1, backoff_base=0.5, backoff_max=8)
+
+    with mock.patch.object(client._session, 'post', return_value=ors_response(503)), \
+            mock.patch('api.clients.time.sleep'):
+        with pytest.raises(openrouteservice.exceptions.ApiError):
+            client.request('/optimization', {}, post_json={'jobs': []})
+
+
+class FakeMapboxSession:
+    def __init__(self, suggestions):
+        self.suggestions = suggestions
+        self.retrieved = []
+
+    def get(self, url, timeout=None):
+        response = mock.MagicMock()
+        if '/suggest' in url:
+            response.json.return_value = {'suggestions': self.suggestions}
+        else:
+            mapbox_id = url.split('/retrieve/')[1].split('?')[0]
+            self.retrieved.append(mapbox_id)
+            index = int(mapbox_id.split('-')[1])
+            response.json.return_value = {'features': [{'geometry': {'coordinates': [17.0 + index, 51.0]}}]}
+        return response
+
+
+@pytest.mark.django_db
+def test_fetch_additional_places_retrieves_needed_places_in_order(settings, itinerary):
+    settings.MAPBOX_MAX_CONCURRENT_REQUESTS = 3
+    caches['mapbox'].clear()
+    suggestions = [{'mapbox_id': 'category-0', 'feature_type': 'category', 'name': 'Museums'}] + [
+        {'mapbox_id': f'poi-{idx}', 'feature_type': 'poi', 'name': f'Museum {idx}', 'poi_category_ids': ['museum']}
+        for idx in range(1, 6)
+    ]
+    session = FakeMapboxSession(suggestions)
+
+    with mock.patch('api.mapbox.get_mapbox_session', return_value=session):
+        places, durations = OptimizeRouteView.fetch_additional_places(itinerary, 400)
+
+    assert sorted(session.retrieved) == ['poi-1', 'poi-2', 'poi-3']
+    assert [place.name for place in places] == ['Museum 1', 'Museum 2', 'Museum 3']
+    assert [place.longitude for place in places] == [18.0, 19.0, 20.0]
+    assert durations == [180, 180, 180]
+
+
+def test_mapbox_suggest_does_not_cache_failed_responses():
+    caches['mapbox'].clear()
+    session = mock.MagicMock()
+    session.get.return_value.ok = False
+    session.get.return_value.status_code = 429
+
+    with mock.patch('api.mapbox.get_mapbox_session', return_value=session):
+        assert mapbox.suggest('museum', 17.03, 51.11, 'token') == []
+        session.get.return_value.ok = True
+        session.get.return_value.json.return_value = {'suggestions': [{'mapbox_id': 'poi-1'}]}
+        assert mapbox.suggest('museum', 17.03, 51.11, 'token') == [{'mapbox_id': 'poi-1'}]
+
+    assert session.get.call_count == 2
+    session.get.return_value.json.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_fetch_additional_places_replaces_places_without_location(itinerary):
+    caches['mapbox'].clear()
+    suggestions = [
+        {'mapbox_id': f'poi-{idx}', 'feature_type': 'poi', 'name': f'Museum {idx}', 'poi_category_ids': ['museum']}
+        for idx in range(1, 6)
+    ]
+    session = FakeMapboxSession(suggestions)
+    get = session.get
+
+    def get_without_poi_2(url, timeout=None):
+        response = get(url, timeout)
+        if '/retrieve/poi-2?' in url:
+            response.json.return_value = {'features': []}
+        return response
+
+    with mock.patch('api.mapbox.get_mapbox_session', return_value=session), \
+            mock.patch.object(session, 'get', side_effect=get_without_poi_2):
+        places, durations = OptimizeRouteView.fetch_additional_places(itinerary, 400)
+
+    # Museum 2 could not be located, so the next suggestion still covers the shortfall
+    assert [place.name for place in places] == ['Museum 1', 'Museum 3', 'Museum 4']
+    assert durations == [180, 180, 180]
+
+
+@pytest.mark.django_db
+def test_fetch_additional_places_uses_mapbox_cache(itinerary):
+    caches['mapbox'].clear()
+    suggestions = [
+        {'mapbox_id': f'poi-{idx}', 'feature_type': 'poi', 'name': f'Museum {idx}', 'poi_category_ids': ['museum']}
+        for idx in range(1, 4)
+    ]
+    session = FakeMapboxSession(suggestions)
+
+    with mock.patch('api.mapbox.get_mapbox_session', return_value=session), \
+            mock.patch.object(session, 'get', wraps=session.get) as get:
+        OptimizeRouteView.fetch_additional_places(itinerary, 300)
+        calls = get.call_count
+
+        # A start point in the same tile reuses the suggestions, only the third place is retrieved
+        itinerary.start_place_longitude += 0.001
+        places, _ = OptimizeRouteView.fetch_additional_places(itinerary, 500)
+        assert get.call_count == calls + 1
+        assert [place.name for place in places] == ['Museum 1', 'Museum 2', 'Museum 3']
+
+
+@pytest.mark.django_db
+def test_place_near_uses_grid_cells():
+    near = Place.objects.create(name='Near', description='', address='', latitude=51.11, longitude=17.03,
+                                category='museum')
+    across_cell = Place.objects.create(name='Across cell', description='', address='', latitude=51.09,
+                                       longitude=17.06, category='park')
+    Place.objects.create(name='Far', description='', address='', latitude=52.23, longitude=21.01, category='park')
+
+    assert near.grid_cell == Place.grid_cell_for(51.11, 17.03)
+    assert set(Place.objects.near(51.1, 17.04, 5)) == {near, across_cell}
+
+
+@pytest.mark.django_db
+def test_find_local_places_takes_nearest_places_ordered_by_the_database(itinerary):
+    itinerary.start_place_latitude, itinerary.start_place_longitude = 51.1, 17.0
+    # Inserted farthest first, a few kilometers apart at most
+    places = [
+        Place.objects.create(name=f'Place {idx}', description='', address='', latitude=51.1 + 0.0002 * idx,
+                             longitude=17.0 + 0.0003 * idx, category='museum')
+        for idx in range(150, 0, -1)
+    ]
+    Place.objects.create(name='Outside radius', description='', address='', latitude=51.1, longitude=17.074,
+                         category='museum')
+
+    assert list(Place.objects.by_distance(51.1, 17.0)[:2]) == [places[-1], places[-2]]
+    with CaptureQueriesContext(connection) as queries:
+        local_places, durations = OptimizeRouteView.find_local_places(itinerary, 300, [places[-1]])
+
+    assert local_places == [places[-2], places[-3]]
+    assert durations == [180, 180]
+    assert 'ORDER BY' in queries[-1]['sql']
+
+    all_local_places, _ = OptimizeRouteView.find_local_places(itinerary, 10 ** 6, [])
+    assert all_local_places == places[::-1]
+
+
+@pytest.mark.django_db
+def test_ensure_minimum_duration_prefers_stored_places(itinerary):
+    itinerary.end_date = itinerary.start_date
+    itinerary.start_hour, itinerary.end_hour = time(9, 0), time(14, 0)
+    stored = [
+        Place.objects.create(name=f'Stored {idx}', description='', address='', latitude=0.001 * idx,
+                             longitude=0.001 * idx, category='museum')
+        for idx in range(1, 4)
+    ]
+
+    with mock.patch.object(OptimizeRouteView, 'fetch_additional_places') as fetch_additional_places:
+        places, durations = OptimizeRouteView().ensure_minimum_duration(itinerary, [stored[2]], [180])
+
+    fetch_additional_places.assert_not_called()
+    assert places == [stored[2], stored[0]]
+    assert durations == [180, 180]
+
+
+def build_plan(itinerary, stored_places, new_places_count):
+    places = stored_places + [
+        Place(name=f'Fetched {idx}', description='', address='', latitude=1 + 0.001 * idx,
+              longitude=1 + 0.001 * idx, category='museum')
+        for idx in range(new_places_count)
+    ]
+    visits = [
+        Visit(itinerary=itinerary, place=place, day=idx % 3 + 1, duration=60, start_time='10:00:00')
+        for idx, place in enumerate(places)
+    ]
+    return visits, {day: f'geometry-{day}' for day in range(1, 4)}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('plan_size', [5, 50])
+def test_save_visits_and_routes_query_count_is_constant(itinerary, plan_size):
+    stored = [
+        Place.objects.create(name=f'Stored {idx}', description='', address='', latitude=0.001 * idx,
+                             longitude=0.001 * idx, category='museum')
+        for idx in range(plan_size)
+    ]
+    Place.objects.create(name='Fetched 0', description='', address='', latitude=1, longitude=1, category='museum')
+    OptimizeRouteView.save_visits_and_routes(itinerary, *build_plan(itinerary, stored[:1], 1))
+
+    visits, geometries = build_plan(itinerary, stored, plan_size)
+    with CaptureQueriesContext(connection) as queries:
+        OptimizeRouteView.save_visits_and_routes(itinerary, visits, geometries)
+
+    # savepoint, place lookup, place insert, place re-lookup, category lookup + link insert, stored visits,
+    # select + delete changed visits, visit insert, stored routes, result invalidation, version bump, savepoint release
+    assert len(queries) == 14
+    assert Visit.objects.filter(itinerary=itinerary).count() == 2 * plan_size
+    assert Place.objects.filter(name__startswith='Fetched').count() == plan_size
+    assert DailyRoute.objects.filter(itinerary=itinerary).count() == 3
+
+
+def test_optimize_route_serializer_accepts_flat_place_ids():
+    flat = OptimizeRouteSerializer(data={'itinerary_id': 1, 'place_ids': [3, 1, 3]})
+    nested = OptimizeRouteSerializer(data={'itinerary_id': 1, 'places': [{'place_id': 3}, {'place_id': 1}]})
+    both = OptimizeRouteSerializer(data={'itinerary_id': 1, 'places': [], 'place_ids': []})
+    invalid = OptimizeRouteSerializer(data={'itinerary_id': 1, 'place_ids': [1, 'x']})
+
+    assert flat.is_valid(), flat.errors
+    assert flat.validated_data['place_ids'] == [3, 1, 3]
+    assert nested.is_valid(), nested.errors
+    assert nested.validated_data['place_ids'] == [3, 1]
+    assert not both.is_valid()
+    assert not invalid.is_valid()
+
+
+@pytest.mark.django_db
+def test_validate_and_fetch_loads_places_in_one_query(django_assert_num_queries, itinerary, optimize_places):
+    place_ids = [optimize_places[2].id, optimize_places[0].id, optimize_places[2].id]
+
+    with django_assert_num_queries(2):
+        _, places, durations = OptimizeRouteView.validate_and_fetch(itinerary.id, place_ids)
+
+    assert places == [optimize_places[2], optimize_places[0], optimize_places[2]]
+    assert durations == [180, 180, 180]
+
+
+@pytest.mark.django_db
+def test_optimize_route_lists_every_missing_place(authenticated_user, create_itinerary, optimize_places):
+    factory = RequestFactory()
+    request = factory.post('/api/optimize-route/', {
+        'itinerary_id': create_itinerary.id,
+        'place_ids': [optimize_places[0].id, 999998, 999999, 999998],
+    }, content_type='application/json')
+    force_authenticate(request, user=authenticated_user)
+
+    response = OptimizeRouteView.as_view()(request)
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.data['missing_place_ids'] == [999998, 999999]
+
+
+@pytest.mark.django_db
+def test_save_visits_and_routes_only_rewrites_changed_days(itinerary, optimize_places):
+    def plan(first_day_places, geometry_suffix=''):
+        visits = [
+            Visit(itinerary=itinerary, place=place, day=day, duration=60, start_time=f'{9 + idx}:00:00')
+            for day, places in ((1, first_day_places), (2, optimize_places[4:6]), (3, optimize_places[6:8]))
+            for idx, place in enumerate(places)
+        ]
+        return visits, {1: 'route-1', 2: 'route-2', 3: 'route-3' + geometry_suffix}
+
+    assert OptimizeRouteView.save_visits_and_routes(itinerary, *plan(optimize_places[:2])) == [1, 2, 3]
+    untouched_ids = set(Visit.objects.filter(itinerary=itinerary, day=2).values_list('id', flat=True))
+
+    assert OptimizeRouteView.save_visits_and_routes(itinerary, *plan(optimize_places[:2])) == []
+    assert OptimizeRouteView.save_visits_and_routes(itinerary, *plan(optimize_places[1:3], '-changed')) == [1, 3]
+
+    assert set(Visit.objects.filter(itinerary=itinerary, day=2).values_list('id', flat=True)) == untouched_ids
+    assert set(Visit.objects.filter(itinerary=itinerary, day=1).values_list('place_id', flat=True)) == {
+        optimize_places[1].id, optimize_places[2].id}
+    assert DailyRoute.objects.get(itinerary=itinerary, day=3).geometry == 'route-3-changed'
+
+    # Only inserts, which send no signals, still invalidate the cached results
+    OptimizationResult.objects.create(key='cached', itinerary=itinerary, response_data={})
+    visits, geometries = plan(optimize_places[1:3], '-changed')
+    assert OptimizeRouteView.save_visits_and_routes(itinerary, visits, {**geometries, 4: 'route-4'}) == [4]
+    assert not OptimizationResult.objects.filter(itinerary=itinerary).exists()
+
+@pytest.fixture
+def winding_geometry():
+    # A wiggly line of 200 points heading north-east, with odd points ~50 m off its axis
+    return encode_polyline([(17.0 + i * 0.001, 51.0 + i * 0.001 + (i % 2) * 0.0005) for i in range(200)])
+
+
+def test_pack_polyline_round_trips_and_compresses(winding_geometry):
+    packed = pack_polyline(winding_geometry)
+
+    assert unpack_polyline(packed) == winding_geometry
+    assert len(packed) < len(winding_geometry) / 4
+    assert unpack_polyline(pack_polyline('not a polyline')) == 'not a polyline'
+    assert unpack_polyline(pack_polyline('')) == ''
+
+
+def test_simplify_polyline_drops_points_within_tolerance(winding_geometry):
+    assert simplify_polyline(winding_geometry, 0) == winding_geometry
+    assert simplify_polyline(winding_geometry, 0.001) == encode_polyline([(17.0, 51.0), (17.199, 51.1995)])
+
+
+@pytest.mark.django_db
+def test_daily_route_detail_levels(authenticated_user, create_itinerary, winding_geometry):
+    itinerary = create_itinerary
+    DailyRoute.objects.create(itinerary=itinerary, day=1, geometry=winding_geometry)
+
+    def get(detail):
+        request = RequestFactory().get(f'/api/itinerary/{itinerary.id}/daily-routes/1', {'detail': detail})
+        force_authenticate(request, user=authenticated_user)
+        return DailyRouteDetailView.as_view()(request, itinerary_id=itinerary.id, day=1)
+
+    full, low = get('full'), get('low')
+    assert full.data['geometry'] == winding_geometry
+    assert len(low.data['geometry']) < len(get('medium').data['geometry']) == len(winding_geometry)
+    assert low.data['geometry'] == DailyRoute.objects.get(itinerary=itinerary, day=1).geometry_low
+    assert get('ultra').status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_streamed_lists_match_buffered_responses(settings, authenticated_user, create_itinerary, optimize_places):
+    settings.STREAMING_CHUNK_SIZE = 5
+    for idx, place in enumerate(optimize_places):
+        Visit.objects.create(itinerary=create_itinerary, place=place, day=idx % 3 + 1, duration=60,
+                             start_time=time(9 + idx // 3))
+
+    def get(view, url, stream, **kwargs):
+        request = RequestFactory().get(url, {'stream': '1'} if stream else {})
+        force_authenticate(request, user=authenticated_user)
+        return view(request, **kwargs)
+
+    # The buffered place list is paginated, streaming returns the whole catalog in the same order
+    streamed = get(PlaceViewSet.as_view({'get': 'list'}), '/api/places/', True)
+    buffered = PlaceSerializer(Place.objects.order_by('id'), many=True).data
+    assert b''.join(streamed.streaming_content) == JSONRenderer().render(buffered)
+
+    view, url = ItineraryVisitsView.as_view(), f'/api/itinerary/{create_itinerary.id}/visits/'
+    streamed = get(view, url, True, itinerary_id=create_itinerary.id)
+    assert streamed.streaming
+    assert streamed['Content-Type'] == 'application/json'
+    buffered = get(view, url, False, itinerary_id=create_itinerary.id).render()
+    assert b''.join(streamed.streaming_content) == buffered.content
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_walks_places_without_offset(authenticated_user, optimize_places):
+    view = PlaceViewSet.as_view({'get': 'list'})
+    url, seen = '/api/places/?page_size=5', []
+    while url:
+        request = RequestFactory().get(url)
+        force_authenticate(request, user=authenticated_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+        assert 'OFFSET' not in queries[-1]['sql']
+        seen.extend(place['id'] for place in response.data['results'])
+        url = response.data['next']
+
+    assert seen == sorted(place.id for place in optimize_places)
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_orders_visits_by_itinerary_day_and_start_time(authenticated_user, create_itinerary,
+                                                                         optimize_places):
+    other_itinerary = Itinerary.objects.create(
+        user=authenticated_user, title='Other Itinerary', start_place_latitude=0.0, start_place_longitude=0.0,
+        start_date=date(2023, 2, 1), end_date=date(2023, 2, 10), start_hour=time(9, 0), end_hour=time(18, 0))
+    for itinerary in [other_itinerary, create_itinerary]:
+        for idx, place in enumerate(optimize_places):
+            Visit.objects.create(itinerary=itinerary, place=place, day=3 - idx % 3, duration=60,
+                                 start_time=time(9 + idx // 3))
+
+    view = VisitViewSet.as_view({'get': 'list'})
+    url, seen = '/api/visits/?page_size=4', []
+    while url:
+        request = RequestFactory().get(url)
+        force_authenticate(request, user=authenticated_user)
+        response = view(request)
+        seen.extend((visit['itinerary'], visit['day'], visit['start_time']) for visit in response.data['results'])
+        url = response.data['next']
+
+    assert len(seen) == 2 * len(optimize_places)
+    assert seen == sorted(seen)
+
+    request = RequestFactory().get('/api/visits/', {'cursor': 'garbage'})
+    force_authenticate(request, user=authenticated_user)
+    assert view(request).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('visits_count', [1, 10, 500])
+def test_visit_endpoints_query_count_is_constant(django_assert_num_queries, authenticated_user, create_itinerary,
+                                                 visits_count):
+    places = Place.objects.bulk_create([
+        Place(name=f'Place {idx}', description='', address='', latitude=0.001 * idx, longitude=0.001 * idx,
+              category='museum')
+        for idx in range(visits_count)
+    ])
+    Visit.objects.bulk_create([
+        Visit(itinerary=create_itinerary, place=place, day=idx % 10 + 1, duration=60, start_time=time(9))
+        for idx, place in enumerate(places)
+    ])
+
+    def get(view, url, **kwargs):
+        request = RequestFactory().get(url)
+        force_authenticate(request, user=authenticated_user)
+        response = view(request, **kwargs)
+        return b''.join(response.streaming_content) if response.streaming else response.data
+
+    with django_assert_num_queries(1):
+        data = get(VisitViewSet.as_view({'get': 'list'}), '/api/visits/?page_size=500')
+    assert len(data['results']) == visits_count
+    assert data['results'][-1]['place_name'].startswith('Place ')
+
+    visits_view = ItineraryVisitsView.as_view()
+    url = f'/api/itinerary/{create_itinerary.id}/visits/'
+    with django_assert_num_queries(2):
+        assert len(get(visits_view, url, itinerary_id=create_itinerary.id)['visits']) == visits_count
+    with django_assert_num_queries(2):
+        get(visits_view, f'{url}?stream=1', itinerary_id=create_itinerary.id)
+
+
+@pytest.mark.django_db
+def test_explain_queries_finds_no_table_scans(create_itinerary, optimize_places):
+    output = StringIO()
+    call_command('explain_queries', '--strict', stdout=output)
+
+    assert 'visit_schedule_idx' in output.getvalue()
+    assert 'itinerary_user_id_idx' in output.getvalue()
+    # The local places query is the one optimize-route runs, sorted by distance
+    local_places = output.getvalue().split('POST /api/optimize-route/ (local places)')[1]
+    assert 'distance_squared' in local_places
+    assert 'USE TEMP B-TREE' in local_places and 'Sort expected' in local_places
+
+
+@pytest.mark.django_db
+def test_values_serializer_matches_model_serializers(create_itinerary, optimize_places):
+    create_itinerary.photo_url = None
+    create_itinerary.save()
+    for idx, place in enumerate(optimize_places):
+        Visit.objects.create(itinerary=create_itinerary, place=place, day=idx % 3 + 1, duration=60,
+                             start_time=time(9 + idx // 3, 30))
+
+    for serializer_class, queryset in [(ItinerarySerializer, Itinerary.objects.order_by('id')),
+                                       (VisitSerializer, Visit.objects.select_related('place').order_by('id'))]:
+        values_serializer = ValuesSerializer(serializer_class)
+        rows = values_serializer.serialize(values_serializer.values(queryset))
+        assert JSONRenderer().render(rows) == JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+
+@pytest.mark.django_db
+def test_benchmark_serialization_reports_rows_per_second():
+    output = StringIO()
+    call_command('benchmark_serialization', '--rows', '20', '--repeat', '1', stdout=output)
+
+    assert output.getvalue().count('rows/s') == 4
+    assert not Itinerary.objects.exists()
+
+
+@pytest.mark.django_db
+def test_itinerary_version_follows_plan_changes(create_itinerary, optimize_places):
+    def version():
+        return Itinerary.objects.get(pk=create_itinerary.pk).version
+
+    assert create_itinerary.version == 1
+    create_itinerary.title = 'Renamed'
+    create_itinerary.save()
+    assert create_itinerary.version == version() == 2
+
+    plan = [Visit(itinerary=create_itinerary, place=optimize_places[0], day=1, duration=60, start_time='09:00:00')]
+    OptimizeRouteView.save_visits_and_routes(create_itinerary, plan, {1: 'route-1'})
+    assert version() == 3
+    OptimizeRouteView.save_visits_and_routes(create_itinerary, plan, {1: 'route-1'})
+    assert version() == 3
+
+    DailyRoute.objects.get(itinerary=create_itinerary, day=1).delete()
+    assert version() == 4
+    optimize_places[0].name = 'Renamed place'
+    optimize_places[0].save()
+    assert version() == 5
+
+
+@pytest.mark.django_db
+def test_itinerary_read_views_answer_conditional_gets(settings, django_assert_num_queries, authenticated_user,
+                                                      create_itinerary, optimize_places, winding_geometry):
+    settings.CACHES = dict(settings.CACHES, responses={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    Visit.objects.create(itinerary=create_itinerary, place=optimize_places[0], day=1, duration=60,
+                         start_time=time(9))
+    DailyRoute.objects.create(itinerary=create_itinerary, day=1, geometry=winding_geometry)
+
+    def get(view, url, headers=None, **kwargs):
+        request = RequestFactory().get(url, headers=headers)
+        force_authenticate(request, user=authenticated_user)
+        return view(request, itinerary_id=create_itinerary.id, **kwargs)
+
+    visits_view, visits_url = ItineraryVisitsView.as_view(), f'/api/itinerary/{create_itinerary.id}/visits/'
+    route_view, route_url = DailyRouteDetailView.as_view(), f'/api/itinerary/{create_itinerary.id}/daily-routes/1'
+    visits = get(visits_view, visits_url)
+    full, low = get(route_view, route_url, day=1), get(route_view, f'{route_url}?detail=low', day=1)
+    assert visits['Last-Modified']
+    assert len({visits['ETag'], full['ETag'], low['ETag']}) == 3
+
+    for view, url, response, kwargs in [(visits_view, visits_url, visits, {}),
+                                        (visits_view, f'{visits_url}?stream=1', visits, {}),
+                                        (route_view, route_url, full, {'day': 1})]:
+        with django_assert_num_queries(1):
+            not_modified = get(view, url, {'If-None-Match': response['ETag']}, **kwargs)
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not_modified['ETag'] == response['ETag']
+
+    with django_assert_num_queries(1):
+        since = get(visits_view, visits_url, {'If-Modified-Since': visits['Last-Modified']})
+    assert since.status_code == status.HTTP_304_NOT_MODIFIED
+
+    Visit.objects.filter(itinerary=create_itinerary).get().delete()
+    changed = get(visits_view, visits_url, {'If-None-Match': visits['ETag']})
+    assert changed.status_code == status.HTTP_200_OK
+    assert changed.data['visits'] == []
+    assert get(route_view, route_url, {'If-None-Match': full['ETag']}, day=1).status_code == status.HTTP_200_OK
+
+    request = RequestFactory().get('/api/itinerary/0/visits/')
+    force_authenticate(request, user=authenticated_user)
+    missing = visits_view(request, itinerary_id=0)
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.fixture(params=['locmem', 'file', 'db'])
+def response_cache(request, settings, tmp_path):
+    backends = {
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-responses'},
+        'file': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)},
+        'db': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_responses'},
+    }
+    settings.CACHES = dict(settings.CACHES, responses=backends[request.param])
+    if request.param == 'db':
+        call_command('createcachetable', 'test_responses')
+    return caches['responses']
+
+
+@pytest.mark.django_db
+def test_itinerary_read_responses_are_cached_until_a_change(response_cache, authenticated_user, create_itinerary,
+                                                            optimize_places, winding_geometry):
+    visit = Visit.objects.create(itinerary=create_itinerary, place=optimize_places[0], day=1, duration=60,
+                                 start_time=time(9))
+    DailyRoute.objects.create(itinerary=create_itinerary, day=1, geometry=winding_geometry)
+    other_user = User.objects.create_user(username='other', password='12345')
+
+    def get(view, url, user=authenticated_user, **kwargs):
+        request = RequestFactory().get(url)
+        force_authenticate(request, user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, **kwargs)
+        # The database cache backend reads its own table
+        return response, len([query for query in queries if 'test_responses' not in query['sql']])
+
+    visits_view = ItineraryVisitsView.as_view()
+    visits_url = f'/api/itinerary/{create_itinerary.id}/visits/'
+    reads = [
+        (visits_view, visits_url, {'itinerary_id': create_itinerary.id}),
+        (DailyRouteDetailView.as_view(), f'/api/itinerary/{create_itinerary.id}/daily-routes/1?detail=low',
+         {'itinerary_id': create_itinerary.id, 'day': 1}),
+        (ItineraryViewSet.as_view({'get': 'retrieve'}), f'/api/itineraries/{create_itinerary.id}/',
+         {'pk': str(create_itinerary.id)}),
+    ]
+    # Hits read nothing from a shared cache, and only the version of the itinerary with a per-process one
+    hit_queries = 1 if isinstance(response_cache, LocMemCache) else 0
+    for view, url, kwargs in reads:
+        first, first_queries = get(view, url, **kwargs)
+        cached, cached_queries = get(view, url, **kwargs)
+        assert first_queries > 1 and cached_queries == hit_queries
+        assert cached.status_code == status.HTTP_200_OK
+        assert cached.data == first.data
+        assert cached.get('ETag') == first.get('ETag')
+
+    # Keyed per user: someone else's request is not answered from the owner's cache
+    assert get(reads[2][0], reads[2][1], user=other_user, **reads[2][2])[0].status_code == status.HTTP_404_NOT_FOUND
+
+    changes = [
+        lambda: Visit.objects.filter(pk=visit.pk).get().save(),
+        lambda: DailyRoute.objects.get(itinerary=create_itinerary, day=1).save(),
+        lambda: Itinerary.objects.get(pk=create_itinerary.pk).save(),
+        lambda: Place.objects.filter(pk=optimize_places[0].pk).get().save(),
+    ]
+    for change in changes:
+        change()
+        for view, url, kwargs in reads:
+            assert get(view, url, **kwargs)[1] > 1
+            assert get(view, url, **kwargs)[1] == hit_queries
+
+    # A change made by another process, whose invalidation only reaches a shared cache
+    Itinerary.objects.filter(pk=create_itinerary.pk).update(title='Renamed', version=F('version') + 1)
+    if hit_queries == 0:
+        caches.create_connection('responses').delete(generation_key(create_itinerary.pk))
+    for view, url, kwargs in reads:
+        assert get(view, url, **kwargs)[1] > 1
+    assert get(reads[2][0], reads[2][1], **reads[2][2])[0].data['title'] == 'Renamed'
+
+    optimize_places[0].delete()
+    response, queries_count = get(visits_view, visits_url, itinerary_id=create_itinerary.id)
+    assert queries_count > 0
+    assert response.data['visits'] == []
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def check_fake_connection(connection):
+    if not connection.healthy:
+        raise ConnectionError
+
+
+def test_connection_pool_reuses_and_limits_connections():
+    metrics.reset()
+    pool = ConnectionPool('db_pool.test', FakeConnection, check=check_fake_connection, min_size=1, max_size=2,
+                          timeout=0.05)
+
+    first = pool.checkout()
+    second = pool.checkout()
+    assert first is not second
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+
+    pool.checkin(first)
+    assert pool.checkout() is first
+    first.healthy = False
+    pool.checkin(first)
+    replacement = pool.checkout()
+    assert replacement is not first and first.closed
+
+    pool.checkin(second, discard=True)
+    assert second.closed
+    assert pool.stats() == {'in_use': 1, 'idle': 0, 'max_size': 2}
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['db_pool.test.timeouts'] == 1
+    assert snapshot['counters']['db_pool.test.health_check_failures'] == 1
+    assert snapshot['counters']['db_pool.test.connections_opened'] == 3
+    assert snapshot['gauges']['db_pool.test.in_use'] == 1
+    assert snapshot['timings']['db_pool.test.wait']['count'] == 4
+
+
+def test_connection_pool_replaces_expired_connections():
+    pool = ConnectionPool('db_pool.test', FakeConnection, max_size=1, max_lifetime=60)
+
+    connection = pool.checkout()
+    pool.checkin(connection)
+    with mock.patch('api.db.pool.time.monotonic', return_value=pool._opened_at[id(connection)] + 61):
+        replacement = pool.checkout()
+
+    assert replacement is not connection and connection.closed
+
+
+def test_connection_pool_is_shared_by_threads():
+    pool = ConnectionPool('db_pool.test', FakeConnection, min_size=2, max_size=3, timeout=5)
+    in_use, peak, lock = set(), [0], threading.Lock()
+
+    def work():
+        for _ in range(50):
+            connection = pool.checkout()
+            with lock:
+                assert connection not in in_use
+                in_use.add(connection)
+                peak[0] = max(peak[0], len(in_use))
+            with lock:
+                in_use.remove(connection)
+            pool.checkin(connection)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] <= 3
+    assert pool.stats()['in_use'] == 0
+    assert 2 <= pool.stats()['idle'] <= 3
+
+
+def test_pooled_database_wrapper_returns_connections_to_the_pool():
+    settings_dict = dict(connection.settings_dict, ENGINE='api.db.postgresql_pool', NAME='travelplanner',
+                         POOL={'MIN_SIZE': 0, 'MAX_SIZE': 2})
+    wrapper = PooledDatabaseWrapper(settings_dict, alias='pool-test')
+    idle = mock.MagicMock(closed=0, **{'get_transaction_status.return_value': 0})
+    in_transaction = mock.MagicMock(closed=0, **{'get_transaction_status.return_value': 2,
+                                            'rollback.side_effect': wrapper.Database.Error})
+
+    # Set by the stock get_new_connection, which is mocked here
+    wrapper.pool.connector.isolation_level = None
+    with mock.patch.object(wrapper.pool.connector, 'get_new_connection', side_effect=[idle, in_transaction]):
+        wrapper.connection = wrapper.get_new_connection({})
+        wrapper._close()
+        assert wrapper.pool.stats() == {'in_use': 0, 'idle': 1, 'max_size': 2}
+        assert wrapper.get_new_connection({}) is idle
+
+        wrapper.connection = wrapper.get_new_connection({})
+        wrapper._close()
+    assert in_transaction.close.called
+    assert wrapper.pool.stats() == {'in_use': 1, 'idle': 0, 'max_size': 2}
+
+
+def test_async_ors_client_retries_throttled_requests():
+    metrics.reset()
+    responses = iter([httpx.Response(429), httpx.Response(502), httpx.Response(200, json={'routes': []})])
+    requests_sent = []
+
+    def handler(request):
+        requests_sent.append(request)
+        return next(responses)
+
+    sync_client = PooledORSClient(key='key', pool_size=4, max_retries=3, backoff_base=0.5, backoff_max=8)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            return await AsyncORSClient(sync_client, http_client).request('/optimization', {'jobs': []})
+
+    with mock.patch('api.clients.asyncio.sleep') as sleep:
+        assert async_to_sync(run)() == {'routes': []}
+
+    assert len(requests_sent) == 3
+    assert requests_sent[0].headers['Authorization'] == 'key'
+    assert sleep.call_count == 2
+    assert metrics.snapshot()['counters']['ors.retries'] == 2
+
+
+def test_async_ors_client_maps_connection_errors():
+    metrics.reset()
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        raise httpx.ConnectError('connection refused', request=request)
+
+    sync_client = PooledORSClient(key='key', pool_size=4, max_retries=2, backoff_base=0.5, backoff_max=8)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            return await AsyncORSClient(sync_client, http_client).request('/optimization', {'jobs': []})
+
+    with mock.patch('api.clients.asyncio.sleep'):
+        with pytest.raises(openrouteservice.exceptions.ApiError) as error:
+            async_to_sync(run)()
+
+    assert error.value.status == 503
+    assert len(attempts) == 3
+    assert metrics.snapshot()['counters']['ors.connection_errors'] == 3
+
+
+def test_mapbox_asuggest_does_not_cache_failed_responses(settings):
+    caches['mapbox'].clear()
+    responses = iter([httpx.Response(503, text='Service Unavailable'),
+                      httpx.Response(200, json={'suggestions': [{'mapbox_id': 'poi-1'}]})])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: next(responses))) as client:
+            with mock.patch('api.mapbox.get_async_http_client', return_value=client):
+                return [await mapbox.asuggest('museum', 17.03, 51.11, 'token') for _ in range(3)]
+
+    assert async_to_sync(run)() == [[], [{'mapbox_id': 'poi-1'}], [{'mapbox_id': 'poi-1'}]]
+
+
+class FakeAsyncMapboxClient:
+    def __init__(self, suggestions):
+        self.session = FakeMapboxSession(suggestions)
+
+    async def get(self, url, timeout=None):
+        await asyncio.sleep(0)
+        return self.session.get(url)
+
+
+class ConcurrentFakeSolver:
+    """Answers like fake_optimize_segment once every segment of the request is being solved."""
+
+    def __init__(self, segments_count):
+        self.segments_count = segments_count
+        self.in_flight = 0
+
+    async def asolve(self, jobs, vehicles):
+        self.in_flight += 1
+        while self.in_flight < self.segments_count:
+            await asyncio.sleep(0.001)
+        routes = [
+            {
+                'vehicle': vehicle.id,
+                'geometry': f'geometry-{vehicle.id}',
+                'steps': [{'type': 'job', 'job': job.id, 'arrival': 32400 + 3600 * step}
+                          for step, job in enumerate(jobs[vehicle.id::len(vehicles)])],
+            } for vehicle in vehicles
+        ]
+        return {'routes': routes, 'unassigned': []}
+
+
+@pytest.mark.django_db
+def test_async_optimize_route_view(authenticated_user, create_itinerary, optimize_places):
+    caches['mapbox'].clear()
+    suggestions = [
+        {'mapbox_id': f'poi-{idx}', 'feature_type': 'poi', 'name': f'Museum {idx}', 'poi_category_ids': ['museum']}
+        for idx in range(1, 20)
+    ]
+    mapbox_client = FakeAsyncMapboxClient(suggestions)
+    view = AsyncOptimizeRouteView.as_view()
+
+    def post(data, **headers):
+        request = RequestFactory().post('/api/optimize-route/', data, content_type='application/json', headers=headers)
+        return async_to_sync(view)(request)
+
+    auth = {'Authorization': f'Bearer {authenticated_user.access_token}'}
+    body = {'itinerary_id': create_itinerary.id, 'place_ids': [place.id for place in optimize_places]}
+    with mock.patch('api.mapbox.get_async_http_client', return_value=mapbox_client), \
+            mock.patch('api.views.get_route_solver', return_value=ConcurrentFakeSolver(4)):
+        response = post(body, **auth)
+
+    assert response.status_code == status.HTTP_200_OK, response.content
+    data = json.loads(response.content)
+    assert [day['day'] for day in data['days']] == list(range(1, 11))
+    assert data['changed_days'] == list(range(1, 11))
+    # The 12 requested museums fill 2160 of the 4860 minutes needed, Mapbox suggestions fill the rest
+    assert len(mapbox_client.session.retrieved) == 15
+    assert Visit.objects.filter(itinerary=create_itinerary).count() == 27
+
+    assert post(body).status_code == status.HTTP_401_UNAUTHORIZED
+    assert post({'itinerary_id': create_itinerary.id}, **auth).status_code == status.HTTP_400_BAD_REQUEST
+    missing = post({'itinerary_id': create_itinerary.id, 'place_ids': [999999]}, **auth)
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+    assert json.loads(missing.content)['missing_place_ids'] == [999999]
+
+
+@pytest.mark.django_db
+def test_cached_jwt_authentication(settings, tmp_path, authenticated_user, create_itinerary,
+                                   django_assert_num_queries):
+    settings.CACHES = dict(settings.CACHES, auth={
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)})
+    view = ItineraryViewSet.as_view({'get': 'retrieve'})
+    auth_cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+    # The cache as another process sees it
+    other_process_cache = caches.create_connection(settings.AUTH_USER_CACHE_ALIAS)
+
+    def get(user=authenticated_user):
+        request = RequestFactory().get(f'/api/itineraries/{create_itinerary.id}/',
+                                       headers={'Authorization': f'Bearer {user.access_token}'})
+        return view(request, pk=create_itinerary.id)
+
+    assert get().status_code == status.HTTP_200_OK
+    assert auth_cache.get(user_cache_key(authenticated_user.pk)) == authenticated_user
+    assert other_process_cache.get(user_cache_key(authenticated_user.pk)) == authenticated_user
+    # Served from the response cache, so the only query left is the itinerary version, not the user lookup
+    with django_assert_num_queries(1):
+        assert get().status_code == status.HTTP_200_OK
+
+    # Cached users still own their itineraries and don't see anyone else's
+    other = User.objects.create_user(username='other', password='12345')
+    other.access_token = str(RefreshToken.for_user(other).access_token)
+    assert get(other).status_code == status.HTTP_404_NOT_FOUND
+    assert get(other).status_code == status.HTTP_404_NOT_FOUND
+
+    authenticated_user.is_active = False
+    authenticated_user.save()
+    assert auth_cache.get(user_cache_key(authenticated_user.pk)) is None
+    assert other_process_cache.get(user_cache_key(authenticated_user.pk)) is None
+    assert get().status_code == status.HTTP_401_UNAUTHORIZED
+
+    other.delete()
+    assert auth_cache.get(user_cache_key(other.pk)) is None
+    assert get(other).status_code == status.HTTP_401_UNAUTHORIZED
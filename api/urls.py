@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import ItineraryViewSet, PlaceViewSet, VisitViewSet, RegisterView, MyTokenObtainPairView, OptimizeRouteView, \
-    ItineraryVisitsView, RouteViewSet, DailyRouteDetailView
+    ItineraryVisitsView, RouteViewSet, DailyRouteDetailView, OptimizationJobView, \
+    MetricsView, AsyncOptimizeRouteView
 
 router = DefaultRouter()
 router.register(r'itineraries', ItineraryViewSet)
@@ -11,10 +13,14 @@ router.register(r'places', PlaceViewSet)
 router.register(r'visits', VisitViewSet)
 router.register(r'routes', RouteViewSet)
 
+optimize_route_view = AsyncOptimizeRouteView if settings.ASYNC_VIEWS else OptimizeRouteView
+
 urlpatterns = [
-    path('optimize-route/', OptimizeRouteView.as_view(), name='optimize-route'),
+    path('optimize-route/', optimize_route_view.as_view(), name='optimize-route'),
+    path('optimize-route/<int:job_id>/', OptimizationJobView.as_view(), name='optimize-route-job'),
     path('itinerary/<int:itinerary_id>/visits/', ItineraryVisitsView.as_view(), name='itinerary-visits'),
     path('itinerary/<int:itinerary_id>/daily-routes/<int:day>', DailyRouteDetailView.as_view(), name='daily-route-detail'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('register', RegisterView.as_view(), name='register'),
     path('token', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('refresh', TokenRefreshView.as_view(), name='token_refresh'),
@@ -0,0 +1,74 @@
+from functools import cached_property
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Fields whose to_representation leaves the database value unchanged
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.FloatField,
+                      serializers.BooleanField)
+
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of a ``ModelSerializer`` working on ``.values()`` rows.
+
+    The serializer's readable fields are compiled once into (name, lookup, converter) mappers, so rendering
+    a row is a dict comprehension instead of a serializer field walk. The output is the same as the
+    ``ModelSerializer``'s for the supported field types.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def mappers(self):
+        mappers = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+                converter = None
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                converter = None
+            elif isinstance(field, (serializers.DateField, serializers.TimeField, serializers.DateTimeField)):
+                converter = field.to_representation
+            else:
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{name} ({type(field).__name__}) has no values() mapper.")
+            mappers.append((name, field.source.replace('.', '__'), converter))
+        return mappers
+
+    @cached_property
+    def lookups(self):
+        return [lookup for _, lookup, _ in self.mappers]
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def to_representation(self, row):
+        data = {}
+        for name, lookup, converter in self.mappers:
+            value = row[lookup]
+            data[name] = value if converter is None or value is None else converter(value)
+        return data
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class ValuesListMixin:
+    """
+    List views answering from ``values_serializer`` instead of instantiating models and serializers.
+
+    Pagination and ``StreamingListMixin`` work on the ``.values()`` rows as well.
+    """
+
+    values_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        rows = self.values_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.serialize(page))
+        return Response(self.values_serializer.serialize(rows))
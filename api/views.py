@@ -1,27 +1,55 @@
+import asyncio
+import hashlib
+import json
 import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 import openrouteservice.optimization
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connections, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_time
+from django.views import View
 from rest_framework import generics, permissions
 from rest_framework import status
 from rest_framework import viewsets
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
 from rest_framework.generics import GenericAPIView, ListAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView, exception_handler
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import Itinerary, Place, Visit, DailyRoute
+from . import mapbox, metrics
+from .clustering import sweep_partition
+from .conditional import ItineraryConditionalMixin
+from .exceptions import PlacesNotFound
+from .geometry import haversine_distance, simplify_polyline
+from .models import Category, Itinerary, Place, Visit, DailyRoute, OptimizationJob, OptimizationResult
 from .permissions import IsOwner
+from .response_cache import CachedItineraryResponseMixin
 from .serializers import ItinerarySerializer, PlaceSerializer, VisitSerializer, OptimizeRouteSerializer, \
-    DailyRouteSerializer
+    DailyRouteSerializer, OptimizationJobSerializer
 from .serializers import UserSerializer, MyTokenObtainPairSerializer
+from .signals import batched_invalidation, invalidate_itineraries
+from .solvers import get_route_solver
+from .streaming import StreamingListMixin
+from .values import ValuesSerializer, ValuesListMixin
+
+
+def invalid_detail_response():
+    return Response({"error": f"detail must be one of: {', '.join(DailyRoute.DETAIL_LEVELS)}"},
+                    status=status.HTTP_400_BAD_REQUEST)
 
 
 class RegisterView(generics.CreateAPIView):
@@ -46,26 +74,40 @@ class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 
-class ItineraryViewSet(viewsets.ModelViewSet):
+class ItineraryViewSet(CachedItineraryResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Itinerary.objects.all()
     serializer_class = ItinerarySerializer
+    values_serializer = ValuesSerializer(ItinerarySerializer)
     permission_classes = [IsAuthenticated, IsOwner]
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.kwargs['pk'], lambda: super(ItineraryViewSet, self).retrieve(
+            request, *args, **kwargs))
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class PlaceViewSet(viewsets.ModelViewSet):
+class PlaceViewSet(StreamingListMixin, viewsets.ModelViewSet):
     queryset = Place.objects.all()
     serializer_class = PlaceSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
+        category = self.request.query_params.get('category', '').strip().lower()
+        if category:
+            return self.queryset.filter(categories__name=category)
         return self.queryset
 
+    def list(self, request, *args, **kwargs):
+        if self.stream_requested():
+            return self.streaming_response(self.filter_queryset(self.get_queryset()).order_by(*self.keyset_ordering))
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         data = request.data
         name = data.get('name')
@@ -84,13 +126,18 @@ class PlaceViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
-class VisitViewSet(viewsets.ModelViewSet):
+class VisitViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = Visit.objects.all()
     serializer_class = VisitSerializer
+    values_serializer = ValuesSerializer(VisitSerializer)
     permission_classes = [IsAuthenticated]
+    # Led by the itinerary so that the rows come in visit_schedule_idx order, one itinerary after the other
+    keyset_ordering = ('itinerary', 'day', 'start_time', 'id')
 
     def get_queryset(self):
-        return self.queryset.filter(itinerary__user=self.request.user)
+        # An IN subquery rather than a join, which would make the database sort the visits of all itineraries
+        itineraries = Itinerary.objects.filter(user=self.request.user).values('id')
+        return self.queryset.filter(itinerary__in=itineraries).select_related('place')
 
     def perform_create(self, serializer):
         place = serializer.validated_data.get('place')
@@ -98,7 +145,7 @@ class VisitViewSet(viewsets.ModelViewSet):
         if place:
             # Check if the place object is valid or meets certain criteria
             if place.is_valid():  # You should define a method like is_valid() in your Place model
-                serializer.save(duration=place.get_estimated_duration())
+                serializer.save(duration=place.duration)
             else:
                 # Handle the case where the place object is not valid
                 raise ValidationError("The place object is not valid.")
@@ -119,59 +166,238 @@ class OptimizeRouteView(GenericAPIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         itinerary_id = serializer.validated_data['itinerary_id']
-        places_data = serializer.validated_data['places']
+        place_ids = serializer.validated_data['place_ids']
+
+        if request.query_params.get('async') in ('1', 'true'):
+            return self.enqueue_optimization(request, itinerary_id, place_ids)
+
+        detail = request.query_params.get('detail', 'full')
+        if detail not in DailyRoute.DETAIL_LEVELS:
+            return invalid_detail_response()
+
+        response_data, response_status = self.optimize(itinerary_id, place_ids)
+        if detail != 'full' and 'days' in response_data:
+            response_data = self.simplify_response(response_data, detail)
+        return Response(response_data, status=response_status)
+
+    @staticmethod
+    def simplify_response(response_data, detail):
+        tolerance = settings.ROUTE_GEOMETRY_TOLERANCES[detail]
+        days = [
+            dict(day, geometry=simplify_polyline(day['geometry'], tolerance)) if day['geometry'] else day
+            for day in response_data['days']
+        ]
+        return dict(response_data, days=days)
+
+    @staticmethod
+    def enqueue_optimization(request, itinerary_id, place_ids):
+        itinerary = get_object_or_404(Itinerary, pk=itinerary_id)
+        job = OptimizationJob.objects.create(
+            user=request.user,
+            itinerary=itinerary,
+            places=place_ids
+        )
+        return Response({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": reverse('optimize-route-job', kwargs={'job_id': job.id}, request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+
+    def optimize(self, itinerary_id, place_ids):
+        """Run the whole optimization pipeline, returning the response payload and its HTTP status."""
+        itinerary, places, durations = self.validate_and_fetch(itinerary_id, place_ids)
 
-        itinerary, places, durations = self.validate_and_fetch(itinerary_id, places_data)
+        cache_key = self.result_cache_key(itinerary, places, durations)
+        cached_result = OptimizationResult.objects.filter(key=cache_key).first()
+        if cached_result is not None:
+            return dict(cached_result.response_data, changed_days=[]), status.HTTP_200_OK
+
+        requested_places = list(places)
         places, durations = self.ensure_minimum_duration(itinerary, places, durations)
+        days_count, segments, duration_segments, segment_days, segment_offsets = self.plan_segments(
+            itinerary, places, durations)
+        if not segments:
+            return self.no_places_response()
+        segment_results = self.optimize_segments(itinerary, segments, duration_segments, segment_days)
+        return self.save_plan(itinerary, cache_key, requested_places, days_count, segments, duration_segments,
+                              segment_offsets, segment_results)
+
+    async def aoptimize(self, itinerary_id, place_ids):
+        """
+        ``optimize`` for async views: Mapbox and the route solver are awaited on the event loop, and the ORM is
+        reached through ``sync_to_async``.
+        """
+        itinerary, places, durations = await sync_to_async(self.validate_and_fetch)(itinerary_id, place_ids)
+
+        cache_key = self.result_cache_key(itinerary, places, durations)
+        cached_result = await OptimizationResult.objects.filter(key=cache_key).afirst()
+        if cached_result is not None:
+            return dict(cached_result.response_data, changed_days=[]), status.HTTP_200_OK
+
+        requested_places = list(places)
+        places, durations = await self.aensure_minimum_duration(itinerary, places, durations)
+        days_count, segments, duration_segments, segment_days, segment_offsets = self.plan_segments(
+            itinerary, places, durations)
+        if not segments:
+            return self.no_places_response()
+        segment_results = await self.aoptimize_segments(itinerary, segments, duration_segments, segment_days)
+        return await sync_to_async(self.save_plan)(itinerary, cache_key, requested_places, days_count, segments,
+                                                   duration_segments, segment_offsets, segment_results)
+
+    @staticmethod
+    def no_places_response():
+        # Checked before saving the plan, which would otherwise delete every stored day
+        return {"error": "No places to visit were found for this itinerary."}, status.HTTP_400_BAD_REQUEST
+
+    def plan_segments(self, itinerary, places, durations):
+        """
+        Split the places into segments of at most ``MAX_VEHICLES_PER_OPTIMIZATION`` days.
 
+        Returns the days count and, for each segment with places, its places, durations, number of days and the
+        offset of its first day.
+        """
         days_count = (itinerary.end_date - itinerary.start_date).days + 1
 
         # Calculate the number of segments needed
         num_segments = -(-days_count // self.MAX_VEHICLES_PER_OPTIMIZATION)
 
-        # Split places and durations based on the number of segments
-        segment_size = len(places) // num_segments + (len(places) % num_segments > 0)
-        segments = [places[i:i + segment_size] for i in range(0, len(places), segment_size)]
-        duration_segments = [durations[i:i + segment_size] for i in range(0, len(durations), segment_size)]
-
+        segment_days = [
+            min(days_count - segment_index * self.MAX_VEHICLES_PER_OPTIMIZATION, self.MAX_VEHICLES_PER_OPTIMIZATION)
+            for segment_index in range(num_segments)
+        ]
+        segments, duration_segments = self.split_into_segments(itinerary, places, durations, segment_days)
+        # Segments left without places are dropped along with their days, wherever they fall in the trip
+        kept = [index for index, segment in enumerate(segments) if segment]
+        return (days_count, [segments[index] for index in kept], [duration_segments[index] for index in kept],
+                [segment_days[index] for index in kept],
+                [index * self.MAX_VEHICLES_PER_OPTIMIZATION for index in kept])
+
+    def save_plan(self, itinerary, cache_key, requested_places, days_count, segments, duration_segments,
+                  segment_offsets, segment_results):
+        """Store the optimized segments and the result, returning the response payload and its HTTP status."""
         visits = []
         status_codes = []
         all_day_geometries = {}
 
         for segment_index, (segment, duration_segment) in enumerate(zip(segments, duration_segments)):
-            segment_days_count = min(days_count - segment_index * self.MAX_VEHICLES_PER_OPTIMIZATION,
-                                     self.MAX_VEHICLES_PER_OPTIMIZATION)
-
-            optimized_route, status_code = self.optimize_segment(itinerary, segment, duration_segment,
-                                                                 segment_days_count)
+            optimized_route, status_code = segment_results[segment_index]
 
             if 'error' in optimized_route:
-                return Response({"error": optimized_route['error']}, status=status.HTTP_400_BAD_REQUEST)
+                return {"error": optimized_route['error']}, status.HTTP_400_BAD_REQUEST
 
             status_codes.append(status_code)
             segment_visits, day_geometries = self.parse_optimized_route(itinerary, optimized_route, segment,
                                                                         duration_segment,
-                                                                        segment_index * self.MAX_VEHICLES_PER_OPTIMIZATION)
+                                                                        segment_offsets[segment_index])
             visits.extend(segment_visits)
             all_day_geometries.update(day_geometries)
 
-        self.save_visits_and_routes(itinerary, visits, all_day_geometries)
-
-        response_data = self.prepare_response_data(itinerary_id, visits, days_count, all_day_geometries)
-        response_data["status"] = max(status_codes)
+        changed_days = self.save_visits_and_routes(itinerary, visits, all_day_geometries)
+
+        response_data = self.prepare_response_data(itinerary.id, visits, days_count, all_day_geometries)
+        response_data["status"] = max(status_codes, default=0)
+        response_data["changed_days"] = changed_days
+
+        self.store_result(cache_key, itinerary, requested_places + [visit.place for visit in visits], response_data)
+
+        return response_data, status.HTTP_200_OK
+
+    def result_cache_key(self, itinerary, places, durations):
+        """Hash every input that determines the optimization output."""
+        inputs = {
+            "itinerary": [
+                itinerary.id,
+                itinerary.start_date.isoformat(),
+                itinerary.end_date.isoformat(),
+                itinerary.start_hour.isoformat(),
+                itinerary.end_hour.isoformat(),
+                itinerary.start_place_latitude,
+                itinerary.start_place_longitude,
+            ],
+            "places": [[place.id, duration] for place, duration in zip(places, durations)],
+            "solver": [
+                settings.ROUTE_SOLVER_BACKEND,
+                settings.TRAVEL_MATRIX_SOURCE,
+                settings.LOCAL_SOLVER_SPEED_PROFILES,
+                settings.LOCAL_SOLVER_DETOUR_FACTOR,
+                self.MAX_VEHICLES_PER_OPTIMIZATION,
+                self.MINIMUM_REQUIRED_DURATION_PERCENT,
+            ],
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
 
-        return Response(response_data, status=status.HTTP_200_OK)
+    @staticmethod
+    def store_result(cache_key, itinerary, places, response_data):
+        result, _ = OptimizationResult.objects.update_or_create(
+            key=cache_key,
+            defaults={'itinerary': itinerary, 'response_data': response_data}
+        )
+        result.places.set({place.pk for place in places})
 
     def ensure_minimum_duration(self, itinerary, places, durations):
-        total_duration = sum(durations)
+        required_duration = self.missing_duration(itinerary, durations)
+
+        if required_duration > 0:
+            local_places, local_durations = self.find_local_places(itinerary, required_duration, places)
+            places.extend(local_places)
+            durations.extend(local_durations)
+            required_duration -= sum(local_durations)
+
+            if required_duration > 0:
+                self.add_new_places(places, durations, *self.fetch_additional_places(itinerary, required_duration))
+
+        return places, durations
+
+    async def aensure_minimum_duration(self, itinerary, places, durations):
+        required_duration = self.missing_duration(itinerary, durations)
+
+        if required_duration > 0:
+            local_places, local_durations = await sync_to_async(self.find_local_places)(
+                itinerary, required_duration, places)
+            places.extend(local_places)
+            durations.extend(local_durations)
+            required_duration -= sum(local_durations)
+
+            if required_duration > 0:
+                self.add_new_places(places, durations,
+                                    *await self.afetch_additional_places(itinerary, required_duration))
+
+        return places, durations
+
+    def missing_duration(self, itinerary, durations):
+        """Minutes of visits still needed to fill ``MINIMUM_REQUIRED_DURATION_PERCENT`` of the trip."""
         available_time = self.calculate_available_trip_time(itinerary)
-        minimum_required_duration = available_time * self.MINIMUM_REQUIRED_DURATION_PERCENT
+        return available_time * self.MINIMUM_REQUIRED_DURATION_PERCENT - sum(durations)
+
+    @staticmethod
+    def add_new_places(places, durations, new_places, new_durations):
+        known = {(place.name, place.latitude, place.longitude) for place in places}
+        for place, duration in zip(new_places, new_durations):
+            if (place.name, place.latitude, place.longitude) not in known:
+                places.append(place)
+                durations.append(duration)
+
+    @staticmethod
+    def find_local_places(itinerary, required_duration, exclude):
+        """Pick the stored places closest to the itinerary start until they cover ``required_duration``."""
+        latitude, longitude = itinerary.start_place_latitude, itinerary.start_place_longitude
+        radius_km = settings.LOCAL_PLACES_RADIUS_KM
+        start = (longitude, latitude)
+
+        # Nearest first, as ordered by the database; the exact distance is checked below
+        candidates = Place.objects.exclude(pk__in=[place.pk for place in exclude if place.pk]).nearest(
+            latitude, longitude, radius_km)
 
-        if total_duration < minimum_required_duration:
-            required_duration = minimum_required_duration - total_duration
-            new_places, new_durations = self.fetch_additional_places(itinerary, required_duration)
-            places.extend(new_places)
-            durations.extend(new_durations)
+        places = []
+        durations = []
+        for place in candidates.iterator(chunk_size=100):
+            if required_duration <= 0:
+                break
+            if haversine_distance(start, (place.longitude, place.latitude)) > radius_km * 1000:
+                continue
+            places.append(place)
+            durations.append(place.duration)
+            required_duration -= place.duration
 
         return places, durations
 
@@ -185,78 +411,95 @@ class OptimizeRouteView(GenericAPIView):
     @staticmethod
     def fetch_additional_places(itinerary, required_duration):
         session_token = str(uuid.uuid4())
-        proximity = f"{itinerary.start_place_longitude},{itinerary.start_place_latitude}"
-        url = (
-            f"https://api.mapbox.com/search/searchbox/v1/suggest"
-            f"?q=museum"
-            f"&access_token={settings.MAPBOX_API_KEY}"
-            f"&language=en"
-            f"&limit=10"
-            f"&types=category,poi"
-            f"&proximity={proximity}"
-            f"&session_token={session_token}"
-        )
+        suggestions = mapbox.suggest('museum', itinerary.start_place_longitude, itinerary.start_place_latitude,
+                                     session_token)
+        categories = Category.objects.for_names(OptimizeRouteView.suggested_category_names(suggestions))
+
+        places, durations = [], []
+        while required_duration > 0 and suggestions:
+            candidates, suggestions = OptimizeRouteView.suggested_places(suggestions, required_duration, categories)
+            details = mapbox.retrieve_many([mapbox_id for mapbox_id, _, _ in candidates], session_token)
+            required_duration -= OptimizeRouteView.add_located_places(places, durations, candidates, details)
+        return places, durations
 
-        if settings.DEBUG:
-            print(url)
+    @staticmethod
+    async def afetch_additional_places(itinerary, required_duration):
+        session_token = str(uuid.uuid4())
+        suggestions = await mapbox.asuggest('museum', itinerary.start_place_longitude,
+                                            itinerary.start_place_latitude, session_token)
+        categories = await sync_to_async(Category.objects.for_names)(
+            OptimizeRouteView.suggested_category_names(suggestions))
+
+        places, durations = [], []
+        while required_duration > 0 and suggestions:
+            candidates, suggestions = OptimizeRouteView.suggested_places(suggestions, required_duration, categories)
+            details = await mapbox.aretrieve_many([mapbox_id for mapbox_id, _, _ in candidates], session_token)
+            required_duration -= OptimizeRouteView.add_located_places(places, durations, candidates, details)
+        return places, durations
 
-        response = requests.get(url)
-        response.encoding = 'utf-8'
-        response_data = response.json()
-        places = []
-        durations = []
+    @staticmethod
+    def suggested_category_names(suggestions):
+        return {name for result in suggestions
+                for name in Place.parse_category(",".join(result.get('poi_category_ids') or []))}
 
-        for result in response_data.get('suggestions', []):
-            if required_duration <= 0:
-                break
-            place_id = result.get('mapbox_id')
-            if not place_id:
+    @staticmethod
+    def suggested_places(suggestions, required_duration, categories):
+        """
+        (mapbox id, unsaved place, duration) of the suggested POIs needed to cover ``required_duration``, and the
+        suggestions left after them; ``categories`` maps the names of their categories to Category.
+        """
+        # Durations only depend on the suggestion, so the places needed are known before any retrieve call
+        candidates = []
+        position = 0
+        while position < len(suggestions) and required_duration > 0:
+            result = suggestions[position]
+            position += 1
+            if not result.get('mapbox_id') or result.get('feature_type') != 'poi':
                 continue
 
-            # Fetch place details using the Mapbox ID
-            place_detail_url = (
-                f"https://api.mapbox.com/search/searchbox/v1/retrieve/"
-                f"{place_id}"
-                f"?access_token={settings.MAPBOX_API_KEY}"
-                f"&session_token={session_token}"
+            place = Place(
+                name=result['name'],
+                description='',
+                address=result.get('place_formatted', ''),
+                category=",".join(result.get('poi_category_ids') or [])
             )
+            duration = place.estimate_duration(categories)
+            candidates.append((result['mapbox_id'], place, duration))
+            required_duration -= duration
+        return candidates, suggestions[position:]
 
-            place_response = requests.get(place_detail_url)
-            place_response.encoding = 'utf-8'
-            place_detail_data = place_response.json()
-
-            if settings.DEBUG:
-                print(place_detail_url)
-
-            if result.get('feature_type') == 'poi':
-                coordinates = place_detail_data['features'][0]['geometry']['coordinates']
-
-                place = Place(
-                    name=result['name'],
-                    description='',
-                    address=result.get('place_formatted', ''),
-                    latitude=coordinates[1],
-                    longitude=coordinates[0],
-                    category=",".join(result.get('poi_category_ids'))
-                )
+    @staticmethod
+    def add_located_places(places, durations, candidates, details):
+        """
+        Add the candidates located by their retrieved features to ``places``, dropping those without one, and
+        return the duration added.
+        """
+        added = 0
+        for (_, place, duration), place_detail_data in zip(candidates, details):
+            features = place_detail_data.get('features')
+            if not features:
+                continue
 
-                places.append(place)
-                duration = place.get_estimated_duration()
-                durations.append(duration)
-                required_duration -= duration
+            coordinates = features[0]['geometry']['coordinates']
+            place.latitude = coordinates[1]
+            place.longitude = coordinates[0]
+            places.append(place)
+            durations.append(duration)
+            added += duration
 
-        return places, durations
+        return added
 
     @staticmethod
-    def validate_and_fetch(itinerary_id, places_data):
+    def validate_and_fetch(itinerary_id, place_ids):
         itinerary = get_object_or_404(Itinerary, pk=itinerary_id)
-        places = []
-        durations = []
+        places_by_id = Place.objects.in_bulk(set(place_ids))
 
-        for place_data in places_data:
-            place = get_object_or_404(Place, pk=place_data['place_id'])
-            places.append(place)
-            durations.append(place.get_estimated_duration())
+        missing = [place_id for place_id in dict.fromkeys(place_ids) if place_id not in places_by_id]
+        if missing:
+            raise PlacesNotFound(missing)
+
+        places = [places_by_id[place_id] for place_id in place_ids]
+        durations = [place.duration for place in places]
 
         return itinerary, places, durations
 
@@ -288,18 +531,62 @@ class OptimizeRouteView(GenericAPIView):
         ]
         return jobs
 
+    @staticmethod
+    def split_into_segments(itinerary, places, durations, segment_days):
+        """
+        Group places into geographically compact segments sized to the number of days of each segment; a segment
+        may be left empty.
+        """
+        groups = sweep_partition(
+            (itinerary.start_place_longitude, itinerary.start_place_latitude),
+            [(place.longitude, place.latitude) for place in places],
+            durations,
+            segment_days
+        )
+        segments = [[places[index] for index in group] for group in groups]
+        duration_segments = [[durations[index] for index in group] for group in groups]
+        return segments, duration_segments
+
+    def optimize_segments(self, itinerary, segments, duration_segments, segment_days):
+        """Optimize all segments concurrently, returning their results in segment order."""
+        max_workers = min(settings.OPTIMIZATION_MAX_WORKERS, len(segments))
+
+        if max_workers <= 1:
+            return [self.optimize_segment(itinerary, *args) for args in zip(segments, duration_segments, segment_days)]
+
+        def optimize_in_thread(args):
+            try:
+                return self.optimize_segment(itinerary, *args)
+            finally:
+                # Solvers may query the matrix cache; drop the connection opened by this worker thread
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(optimize_in_thread, zip(segments, duration_segments, segment_days)))
+
+    async def aoptimize_segments(self, itinerary, segments, duration_segments, segment_days):
+        """Optimize all segments concurrently on the event loop, returning their results in segment order."""
+        solver = get_route_solver()
+        return await asyncio.gather(*(
+            self.aoptimize_segment(solver, itinerary, *args) for args in zip(segments, duration_segments, segment_days)
+        ))
+
     def optimize_segment(self, itinerary, places, durations, days_count):
-        ors_client = openrouteservice.Client(key=settings.OPENROUTESERVICE_API_KEY)
         vehicles = self.create_vehicles(itinerary, days_count)
         jobs = self.create_jobs(places, durations)
 
-        optimized_route = openrouteservice.optimization.optimization(
-            ors_client,
-            jobs=jobs,
-            vehicles=vehicles,
-            geometry=True
-        )
+        optimized_route = get_route_solver().solve(jobs, vehicles)
+        return optimized_route, self.route_status(optimized_route, vehicles)
+
+    async def aoptimize_segment(self, solver, itinerary, places, durations, days_count):
+        vehicles = self.create_vehicles(itinerary, days_count)
+        jobs = self.create_jobs(places, durations)
 
+        optimized_route = await solver.asolve(jobs, vehicles)
+        return optimized_route, self.route_status(optimized_route, vehicles)
+
+    @staticmethod
+    def route_status(optimized_route, vehicles):
         # Initialize status code
         status_code = 0
 
@@ -318,7 +605,7 @@ class OptimizeRouteView(GenericAPIView):
         elif unused_vehicles:
             status_code = 2
 
-        return optimized_route, status_code
+        return status_code
 
     @staticmethod
     def parse_optimized_route(itinerary, optimized_route, places, durations, start_day_offset):
@@ -349,36 +636,98 @@ class OptimizeRouteView(GenericAPIView):
 
     @staticmethod
     def save_visits_and_routes(itinerary, visits, all_day_geometries):
-        with transaction.atomic():
-            # Delete existing visits and routes
-            Visit.objects.filter(itinerary=itinerary).delete()
-            DailyRoute.objects.filter(itinerary=itinerary).delete()
+        """
+        Store the new plan, only rewriting the days whose visits or route differ from the stored ones.
 
-            # Check and save related Place objects first
-            for visit in visits:
-                place, created = Place.objects.get_or_create(
-                    name=visit.place.name,
-                    latitude=visit.place.latitude,
-                    longitude=visit.place.longitude,
-                    defaults={
-                        'description': visit.place.description,
-                        'address': visit.place.address,
-                        'category': visit.place.category,
-                    }
-                )
-                # Assign the saved or fetched place back to the visit
-                visit.place = place
-
-            # Save visits individually to ensure related objects are saved
-            for visit in visits:
-                visit.save()
+        Runs a constant number of queries whatever the number of visits and returns the changed days.
+        """
+        with transaction.atomic(), batched_invalidation():
+            OptimizeRouteView.resolve_places(visits)
 
-            # Create new daily routes
-            daily_routes = [
+            stored_days = defaultdict(set)
+            for place_id, day, duration, start_time in Visit.objects.filter(itinerary=itinerary).values_list(
+                    'place_id', 'day', 'duration', 'start_time'):
+                stored_days[day].add((place_id, duration, start_time))
+
+            new_days = defaultdict(set)
+            for visit in visits:
+                new_days[visit.day].add((visit.place_id, visit.duration, parse_time(str(visit.start_time))))
+
+            changed_visit_days = {day for day in stored_days.keys() | new_days.keys()
+                                  if stored_days.get(day) != new_days.get(day)}
+            if changed_visit_days:
+                # Bulk inserts send no signals, so days that only gain visits would not invalidate anything
+                invalidate_itineraries({itinerary.pk})
+                Visit.objects.filter(itinerary=itinerary, day__in=changed_visit_days).delete()
+                Visit.objects.bulk_create([visit for visit in visits if visit.day in changed_visit_days])
+
+            stored_routes = {route.day: route for route in DailyRoute.objects.filter(itinerary=itinerary)}
+            removed_route_days = stored_routes.keys() - all_day_geometries.keys()
+            updated_routes = []
+            for day, route in stored_routes.items():
+                if day in all_day_geometries and route.geometry != all_day_geometries[day]:
+                    route.geometry = all_day_geometries[day]
+                    route.simplify_geometry()
+                    updated_routes.append(route)
+
+            new_routes = [
                 DailyRoute(itinerary=itinerary, day=day, geometry=geometry)
-                for day, geometry in all_day_geometries.items()
+                for day, geometry in all_day_geometries.items() if day not in stored_routes
             ]
-            DailyRoute.objects.bulk_create(daily_routes)
+            for route in new_routes:
+                route.simplify_geometry()
+
+            if removed_route_days or updated_routes or new_routes:
+                invalidate_itineraries({itinerary.pk})
+            if removed_route_days:
+                DailyRoute.objects.filter(itinerary=itinerary, day__in=removed_route_days).delete()
+            if updated_routes:
+                DailyRoute.objects.bulk_update(updated_routes, ['geometry', 'geometry_medium', 'geometry_low'])
+            DailyRoute.objects.bulk_create(new_routes)
+
+        changed_route_days = removed_route_days | {route.day for route in updated_routes} | (
+            all_day_geometries.keys() - stored_routes.keys())
+        return sorted(changed_visit_days | changed_route_days)
+
+    @staticmethod
+    def resolve_places(visits):
+        """Point visits of unsaved (Mapbox) places at stored places, inserting the missing ones in bulk."""
+        unsaved = [visit.place for visit in visits if visit.place.pk is None]
+        if not unsaved:
+            return
+
+        stored = OptimizeRouteView.stored_places(unsaved)
+        missing = {
+            (place.name, place.latitude, place.longitude): place
+            for place in unsaved if (place.name, place.latitude, place.longitude) not in stored
+        }
+        if missing:
+            for place in missing.values():
+                place.grid_cell = Place.grid_cell_for(place.latitude, place.longitude)
+            Place.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            stored = OptimizeRouteView.stored_places(unsaved)
+            # bulk_create skips Place.save, which links the categories
+            inserted = [stored[key] for key in missing]
+            categories = Category.objects.for_names(name for place in inserted for name in place.category_names)
+            Place.link_categories(inserted, categories)
+
+        for visit in visits:
+            if visit.place.pk is None:
+                visit.place = stored[(visit.place.name, visit.place.latitude, visit.place.longitude)]
+
+    @staticmethod
+    def stored_places(places):
+        """Map (name, latitude, longitude) to the stored Place for each of ``places`` that exists, in one query."""
+        keys = {(place.name, place.latitude, place.longitude) for place in places}
+        candidates = Place.objects.filter(
+            name__in={name for name, _, _ in keys},
+            latitude__in={latitude for _, latitude, _ in keys},
+            longitude__in={longitude for _, _, longitude in keys},
+        )
+        return {
+            (place.name, place.latitude, place.longitude): place
+            for place in candidates if (place.name, place.latitude, place.longitude) in keys
+        }
 
     @staticmethod
     def prepare_response_data(itinerary_id, visits, total_days, all_day_geometries):
@@ -411,50 +760,158 @@ class OptimizeRouteView(GenericAPIView):
         return response_data
 
 
-class ItineraryVisitsView(ListAPIView):
+class AsyncOptimizeRouteView(View):
+    """
+    ``OptimizeRouteView`` as a native async view, routed instead of it when ``ASYNC_VIEWS`` is on.
+
+    Under ASGI a request waiting on Mapbox or OpenRouteService only holds a coroutine on the event loop, not a
+    worker thread; authentication, parsing, errors and responses go through DRF as in the sync view.
+    """
+
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authenticated, like the DRF views
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request):
+        request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                          authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            response = await self.optimize_route(request)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = response.accepted_renderer.media_type
+        response.renderer_context = {'request': request, 'view': self, 'response': response}
+        return response.render()
+
+    async def optimize_route(self, request):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            raise NotAuthenticated()
+
+        serializer = OptimizeRouteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        itinerary_id = serializer.validated_data['itinerary_id']
+        place_ids = serializer.validated_data['place_ids']
+
+        if request.query_params.get('async') in ('1', 'true'):
+            return await sync_to_async(OptimizeRouteView.enqueue_optimization)(request, itinerary_id, place_ids)
+
+        detail = request.query_params.get('detail', 'full')
+        if detail not in DailyRoute.DETAIL_LEVELS:
+            return invalid_detail_response()
+
+        response_data, response_status = await OptimizeRouteView().aoptimize(itinerary_id, place_ids)
+        if detail != 'full' and 'days' in response_data:
+            response_data = OptimizeRouteView.simplify_response(response_data, detail)
+        return Response(response_data, status=response_status)
+
+    def handle_exception(self, request, exc):
+        """Turn ``exc`` into the response ``APIView.handle_exception`` would return."""
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            auth_header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        response = exception_handler(exc, {'request': request, 'view': self, 'args': (), 'kwargs': {}})
+        if response is None:
+            raise exc
+        return response
+
+
+class OptimizationJobView(generics.RetrieveAPIView):
+    serializer_class = OptimizationJobSerializer
+    lookup_url_kwarg = 'job_id'
+
+    def get_queryset(self):
+        return OptimizationJob.objects.filter(user=self.request.user)
+
+
+class ItineraryVisitsView(CachedItineraryResponseMixin, ItineraryConditionalMixin, StreamingListMixin, ListAPIView):
     serializer_class = VisitSerializer
+    values_serializer = ValuesSerializer(VisitSerializer)
 
     def get_queryset(self):
-        itinerary_id = self.kwargs['itinerary_id']
-        itinerary = get_object_or_404(Itinerary, pk=itinerary_id)
-        return Visit.objects.filter(itinerary=itinerary).order_by('day', 'start_time')
+        return Visit.objects.filter(itinerary_id=self.kwargs['itinerary_id']).select_related('place').order_by(
+            'day', 'start_time')
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        if self.stream_requested():
+            return self.render_visits(request)
+        return self.cached_response(request, self.kwargs['itinerary_id'], lambda: self.render_visits(request))
+
+    def render_visits(self, request):
         itinerary_id = self.kwargs['itinerary_id']
+        validators = self.itinerary_validators(itinerary_id)
+        not_modified = self.not_modified_response(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        queryset = self.get_queryset()
+        if self.stream_requested():
+            renderer = JSONRenderer()
+            prefix = b'{"itinerary":' + renderer.render(itinerary_id) + b',"visits":'
+            return self.with_validators(self.streaming_response(queryset, prefix=prefix, suffix=b'}'), validators)
+
         response_data = {
             "itinerary": itinerary_id,
-            "visits": serializer.data
+            "visits": self.values_serializer.serialize(self.values_serializer.values(queryset))
         }
-        return Response(response_data, status=status.HTTP_200_OK)
+        return self.with_validators(Response(response_data, status=status.HTTP_200_OK), validators)
 
 
 class RouteViewSet(viewsets.ModelViewSet):
     queryset = DailyRoute.objects.all()
     serializer_class = DailyRouteSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('itinerary_id', 'day', 'id')
 
     def get_queryset(self):
-        return self.queryset.filter(itinerary__user=self.request.user)
+        return self.queryset.filter(itinerary__in=Itinerary.objects.filter(user=self.request.user).values('id'))
 
     def perform_create(self, serializer):
         serializer.save(itinerary__user=self.request.user)
 
 
-class DailyRouteDetailView(generics.GenericAPIView):
+class DailyRouteDetailView(CachedItineraryResponseMixin, ItineraryConditionalMixin, generics.GenericAPIView):
     serializer_class = DailyRouteSerializer
 
     def get(self, request, itinerary_id, day):
+        detail = request.query_params.get('detail', 'full')
+        if detail not in DailyRoute.DETAIL_LEVELS:
+            return invalid_detail_response()
+        return self.cached_response(
+            request, itinerary_id, lambda: self.render_route(request, itinerary_id, day, detail), day, detail)
+
+    def render_route(self, request, itinerary_id, day, detail):
         try:
-            itinerary = Itinerary.objects.get(id=itinerary_id)
-        except Itinerary.DoesNotExist:
+            validators = self.itinerary_validators(itinerary_id, day, detail)
+        except Http404:
             return Response({"error": "Itinerary not found"}, status=status.HTTP_404_NOT_FOUND)
+        not_modified = self.not_modified_response(request, validators)
+        if not_modified is not None:
+            return not_modified
 
         try:
-            daily_route = DailyRoute.objects.get(itinerary=itinerary, day=day)
+            daily_route = DailyRoute.objects.get(itinerary_id=itinerary_id, day=day)
         except DailyRoute.DoesNotExist:
             return Response({"error": "Daily route not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(daily_route)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = self.get_serializer(daily_route, context=dict(self.get_serializer_context(), detail=detail))
+        return self.with_validators(Response(serializer.data, status=status.HTTP_200_OK), validators)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
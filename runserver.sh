@@ -2,4 +2,14 @@
 
 python manage.py collectstatic --no-input
 python manage.py migrate
-gunicorn TravelPlanner_backend.wsgi --bind=0.0.0.0:80
\ No newline at end of file
+python manage.py run_optimization_worker &
+
+# SERVER_MODE=asgi runs uvicorn workers under gunicorn: set ASYNC_VIEWS=1 so optimize-route waits on Mapbox and
+# OpenRouteService on the event loop, and keep CONN_MAX_AGE at 0 (or use DB_ENGINE=api.db.postgresql_pool).
+# Sync views keep working, each request running in a thread of the worker.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn TravelPlanner_backend.asgi:application --worker-class uvicorn.workers.UvicornWorker \
+        --workers="${WEB_CONCURRENCY:-2}" --bind=0.0.0.0:80
+else
+    gunicorn TravelPlanner_backend.wsgi --bind=0.0.0.0:80
+fi